@@ -2,9 +2,36 @@
 WillOfCode: Specialized Agents
 Each agent is a mini-graph with its own expertise
 """
+import os
+import re
 from agent.state import WillOfCodeState
-from agent.llm import llm_invoke, llm_invoke_json
+from agent.llm import llm_invoke, llm_invoke_json, select_tier
+from agent.diffing import build_edit_payload
+from agent.structured import EDIT_SCHEMA, REFACTOR_SCHEMA
+from agent.prompts import (
+    coder_edit_prompt,
+    coder_generate_prompt,
+    reviewer_refactor_prompt,
+    reviewer_review_prompt,
+    debug_prompt,
+)
 from agent.mcp_client import call_mcp_tool_sync, list_mcp_tools
+from agent.prefetch import read_file_cached
+from agent.memory import history_for_prompt
+
+
+def load_file_context(state: WillOfCodeState) -> tuple:
+    """Return (file_path, file_content): editor content first, else the file named in the query"""
+    file_content = state.get("file_content", "")
+    file_path = state.get("file_path", "")
+    if file_content:
+        return file_path, file_content
+    path = extract_path_from_query(state["user_query"])
+    if path != "." and os.path.isfile(path):
+        content = read_file_cached(path)
+        if content and not content.startswith("ERROR"):
+            return path, content
+    return file_path, file_content
 
 
 # ============================================================================
@@ -13,59 +40,38 @@ from agent.mcp_client import call_mcp_tool_sync, list_mcp_tools
 def coder_agent(state: WillOfCodeState) -> WillOfCodeState:
     """Handles code generation, editing, and creation tasks"""
     query = state["user_query"]
-    file_content = state.get("file_content", "")
-    file_path = state.get("file_path", "")
+    file_path, file_content = load_file_context(state)
     
     # Check if this is an edit request (has existing file content)
     is_edit = bool(file_content)
     
     if is_edit:
         # Editing existing code - use JSON format for structured response
-        prompt = f"""You are editing a file. Make ONLY the requested change.
-CRITICAL: Return the COMPLETE file content with your modification applied.
-Do NOT omit any existing code - include EVERY line from the original file.
-
-Return JSON format:
-{{"modified_code": "THE COMPLETE FILE WITH ALL ORIGINAL LINES PLUS YOUR CHANGE", "changes": "brief description of what you changed"}}
-
-User request: {query}
-
-COMPLETE ORIGINAL FILE:
-```
-{file_content}
-```
-
-Remember: Return the ENTIRE file content, not just the changed parts."""
+        prompt = coder_edit_prompt(query, file_content, history_for_prompt(state))
         
-        result = llm_invoke_json(prompt)
+        result = llm_invoke_json(prompt, tier=select_tier(state.get("intent"), is_edit=True), schema=EDIT_SCHEMA)
         code = result.get("modified_code", "")
         changes = result.get("changes", "Code modified")
-        llm_result = f"## Changes Made\n\n{changes}\n\n*Review the changes in the editor and click Accept to apply*"
         
-        # Set pending action for frontend to show diff
-        pending_action = "stream_to_editor"
-        action_data = {
-            "type": "file_edit",
-            "code": code,
-            "path": file_path,
-            "changes": changes,
-            "original": file_content
-        }
+        if code:
+            llm_result = f"## Changes Made\n\n{changes}\n\n*Review the changes in the editor and click Accept to apply*"
+            # Set pending action for frontend to show diff (hunks only, not both copies)
+            pending_action = "stream_to_editor"
+            action_data = {
+                "type": "file_edit",
+                "path": file_path,
+                "changes": changes,
+                **build_edit_payload(file_content, code)
+            }
+        else:
+            llm_result = f"Could not generate the edit: {result.get('response', 'empty response')}"
+            pending_action = None
+            action_data = None
     else:
         # Generating new code
-        prompt = f"""You are an expert Code Generation Agent.
-Your specialty is writing clean, efficient, and well-documented code.
-
-User Request: {query}
-
-Instructions:
-- Generate high-quality code that solves the user's request
-- Include helpful comments
-- Follow best practices for the language
-
-Provide your response:"""
+        prompt = coder_generate_prompt(query, history_for_prompt(state))
         
-        result = llm_invoke(prompt)
+        result = llm_invoke(prompt, tier=select_tier(state.get("intent")))
         llm_result = result.get("generate", "Error generating code")
         pending_action = None
         action_data = None
@@ -97,9 +103,8 @@ def reviewer_agent(state: WillOfCodeState) -> WillOfCodeState:
     """Handles code review, refactoring, and quality improvements"""
     query = state["user_query"]
     query_lower = query.lower()
-    file_content = state.get("file_content", "")
-    file_path = state.get("file_path", "")
-    code = state.get("code", file_content)
+    file_path, file_content = load_file_context(state)
+    code = state.get("code") or file_content
     
     # Check if this is a refactor/optimize request with existing code
     is_refactor = any(kw in query_lower for kw in ["refactor", "optimize", "improve", "clean"])
@@ -107,51 +112,31 @@ def reviewer_agent(state: WillOfCodeState) -> WillOfCodeState:
     
     if is_refactor and has_code:
         # Refactoring - use JSON format for structured response
-        prompt = f"""You are refactoring code. Return the COMPLETE refactored file.
-
-Return JSON format:
-{{"refactored_code": "THE COMPLETE REFACTORED CODE", "changes": ["change1", "change2"]}}
-
-User request: {query}
-
-ORIGINAL CODE:
-```
-{code}
-```"""
+        prompt = reviewer_refactor_prompt(query, code, history_for_prompt(state))
         
-        result = llm_invoke_json(prompt)
+        result = llm_invoke_json(prompt, tier=select_tier(state.get("intent"), is_edit=True), schema=REFACTOR_SCHEMA)
         refactored = result.get("refactored_code", "")
         changes = result.get("changes", [])
         changes_text = "\n".join(f"- {c}" for c in changes) if isinstance(changes, list) else str(changes)
-        llm_result = f"## Refactored Code\n\n**Changes:**\n{changes_text}\n\n*Review the changes in the editor and click Accept to apply*"
         
-        pending_action = "stream_to_editor"
-        action_data = {
-            "type": "refactor",
-            "code": refactored,
-            "path": file_path,
-            "changes": changes_text,
-            "original": code
-        }
+        if refactored:
+            llm_result = f"## Refactored Code\n\n**Changes:**\n{changes_text}\n\n*Review the changes in the editor and click Accept to apply*"
+            pending_action = "stream_to_editor"
+            action_data = {
+                "type": "refactor",
+                "path": file_path,
+                "changes": changes_text,
+                **build_edit_payload(code, refactored)
+            }
+        else:
+            llm_result = f"Could not refactor the code: {result.get('response', 'empty response')}"
+            pending_action = None
+            action_data = None
     else:
         # Code review only (no refactoring)
-        prompt = f"""You are an expert Code Review Agent.
-Your specialty is analyzing code quality and suggesting improvements.
-
-User Request: {query}
-
-Code to Review:
-{code if code else "No code provided for review."}
-
-Instructions:
-- Analyze code quality, readability, and maintainability
-- Identify potential bugs or issues
-- Suggest specific improvements with examples
-- Rate the code quality (1-10)
-
-Provide your detailed review:"""
+        prompt = reviewer_review_prompt(query, code, history_for_prompt(state))
         
-        result = llm_invoke(prompt)
+        result = llm_invoke(prompt, tier=select_tier(state.get("intent")))
         llm_result = result.get("generate", "Error reviewing code")
         pending_action = None
         action_data = None
@@ -182,26 +167,12 @@ Provide your detailed review:"""
 def debug_agent(state: WillOfCodeState) -> WillOfCodeState:
     """Handles debugging, error analysis, and code explanation"""
     query = state["user_query"]
-    file_content = state.get("file_content", "")
-    code = state.get("code", file_content)
+    _, file_content = load_file_context(state)
+    code = state.get("code") or file_content
     
-    prompt = f"""You are an expert Debug & Analysis Agent.
-Your specialty is finding bugs, explaining code, and solving errors.
-
-User Request: {query}
-
-Code to Analyze:
-{code if code else "No code provided."}
-
-Instructions:
-- If debugging: identify the bug, explain why it happens, and provide the fix
-- If explaining: break down the code logic clearly for all skill levels
-- Provide step-by-step analysis
-- Include fixed code if applicable
-
-Provide your analysis:"""
+    prompt = debug_prompt(query, code, history_for_prompt(state))
     
-    result = llm_invoke(prompt)
+    result = llm_invoke(prompt, tier=select_tier(state.get("intent")))
     
     history = state.get("agent_history", []) or []
     history.append("debug")
@@ -223,7 +194,6 @@ Provide your analysis:"""
 # ============================================================================
 def extract_path_from_query(query: str) -> str:
     """Extract file/folder path from user query"""
-    import re
     # Match Windows paths like D:\folder or C:\path\to\file.py
     win_match = re.search(r'[A-Za-z]:\\[^\s"\']+', query)
     if win_match:
@@ -263,7 +233,8 @@ def file_agent(state: WillOfCodeState) -> WillOfCodeState:
     elif any(kw in query_lower for kw in ["read", "open", "show file", "analyze", "get file"]):
         # Read file
         if path and path != ".":
-            result = call_mcp_tool_sync("read_file", path=path)
+            # Usually already fetched by the supervisor's prefetch
+            result = read_file_cached(path)
             if result and not result.startswith("ERROR"):
                 content = result
                 result_text = f"**File: {path}**\n\n```\n{content}\n```"
@@ -0,0 +1,118 @@
+"""
+WillOfCode: Provider-side Context Cache
+Reuses cached-content handles for the same (model, template, file) across turns
+so a big file is ingested once instead of on every message.
+
+Select the backend with WOC_CONTEXT_CACHE=gemini|local|off (default: gemini
+when GOOGLE_API_KEY is set, otherwise local).
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+from agent.prompts import Prompt
+
+
+CACHE_TTL = int(os.getenv("WOC_CONTEXT_CACHE_TTL", "900"))          # Seconds
+MIN_CACHE_CHARS = int(os.getenv("WOC_CONTEXT_CACHE_MIN_CHARS", "16000"))  # ~4k tokens, below this caching costs more than it saves
+MAX_ENTRIES = 256
+
+
+class CacheHandle(NamedTuple):
+    backend: str        # Which backend created it ("gemini", "local")
+    name: str           # Provider resource name, e.g. "cachedContents/abc123"
+    prefix_hash: str
+    expires_at: float
+
+
+class ContextCache:
+    """No-op cache: never returns a handle"""
+    backend = "off"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._handles = {}      # (model, agent, file_hash) -> CacheHandle
+        self._lock = threading.Lock()
+
+    def handle_for(self, model: str, prompt: Prompt) -> Optional[CacheHandle]:
+        """Return a live handle for the prompt's prefix, creating one if worthwhile"""
+        if not prompt.prefix or len(prompt.prefix) < MIN_CACHE_CHARS:
+            return None
+        key = (model, prompt.agent, prompt.file_hash)
+        prefix_hash = prompt.prefix_hash
+        now = time.time()
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle and handle.prefix_hash == prefix_hash and handle.expires_at > now:
+                self.hits += 1
+                return handle
+            self.misses += 1
+        try:
+            handle = self._create(model, prompt, prefix_hash)
+        except Exception as e:
+            print(f"[CONTEXT CACHE] Could not cache prefix for {prompt.agent}: {e}")
+            return None
+        if handle is None:
+            return None
+        with self._lock:
+            if len(self._handles) >= MAX_ENTRIES:
+                # Drop the entry closest to expiry
+                oldest = min(self._handles, key=lambda k: self._handles[k].expires_at)
+                del self._handles[oldest]
+            self._handles[key] = handle
+        return handle
+
+    def _create(self, model: str, prompt: Prompt, prefix_hash: str) -> Optional[CacheHandle]:
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": self.backend, "hits": self.hits, "misses": self.misses, "entries": len(self._handles)}
+
+
+class LocalContextCache(ContextCache):
+    """In-process stub: hands out fake handles so reuse can be observed in tests"""
+    backend = "local"
+
+    def _create(self, model: str, prompt: Prompt, prefix_hash: str) -> CacheHandle:
+        return CacheHandle(self.backend, f"local/{prefix_hash[:16]}", prefix_hash, time.time() + CACHE_TTL)
+
+
+class GeminiContextCache(ContextCache):
+    """Gemini explicit context caching (cachedContents API)"""
+    backend = "gemini"
+
+    def _create(self, model: str, prompt: Prompt, prefix_hash: str) -> CacheHandle:
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        cached = caching.CachedContent.create(
+            model=f"models/{model}",
+            display_name=f"woc-{prompt.agent}-{prefix_hash[:12]}",
+            system_instruction=prompt.prefix,
+            ttl=timedelta(seconds=CACHE_TTL),
+        )
+        # Expire our handle a little early so we never send a dead one
+        return CacheHandle(self.backend, cached.name, prefix_hash, time.time() + CACHE_TTL - 30)
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """Process-wide context cache, backend chosen from the environment"""
+    global _context_cache
+    with _context_cache_lock:
+        if _context_cache is None:
+            default = "gemini" if os.getenv("GOOGLE_API_KEY") else "local"
+            backend = os.getenv("WOC_CONTEXT_CACHE", default).lower()
+            _context_cache = {
+                "gemini": GeminiContextCache,
+                "local": LocalContextCache,
+            }.get(backend, ContextCache)()
+        return _context_cache
@@ -0,0 +1,120 @@
+"""
+WillOfCode: Line Diffs for Edit Approvals
+The server diffs the original and modified file once and ships compact hunks
+plus a hash of the base, instead of sending both full copies to the browser.
+
+Hunk format (0-based line indexes into the base):
+    {"old_start": 12, "old_count": 2, "lines": ["new line\\n", ...]}
+"""
+import difflib
+from typing import List, Optional
+
+from agent.prompts import content_hash
+
+
+class StaleBaseError(ValueError):
+    """The content hunks are applied to is not the content they were computed against"""
+
+
+class InvalidHunkError(ValueError):
+    """Hunks that are malformed, overlap, or do not fit the (verified) base"""
+
+
+def validate_hunks(hunks, line_count: Optional[int] = None):
+    """Raise InvalidHunkError unless `hunks` are well-formed, non-overlapping and inside `line_count` lines"""
+    if not isinstance(hunks, list):
+        raise InvalidHunkError("hunks must be a list")
+    end = 0
+    for index, hunk in sorted(enumerate(hunks), key=lambda item: _start(item[1])):
+        if not (isinstance(hunk, dict)
+                and type(hunk.get("old_start")) is int and hunk["old_start"] >= 0
+                and type(hunk.get("old_count")) is int and hunk["old_count"] >= 0
+                and isinstance(hunk.get("lines"), list) and all(isinstance(line, str) for line in hunk["lines"])):
+            raise InvalidHunkError(f"Hunk {index} must be {{old_start, old_count, lines}} with non-negative ints and strings")
+        if hunk["old_start"] < end:
+            raise InvalidHunkError(f"Hunk {index} overlaps the previous hunk")
+        end = hunk["old_start"] + hunk["old_count"]
+        if line_count is not None and end > line_count:
+            raise InvalidHunkError(f"Hunk {index} ends at line {end}, past the end of the file ({line_count} lines)")
+
+
+def _start(hunk) -> int:
+    value = hunk.get("old_start") if isinstance(hunk, dict) else None
+    return value if type(value) is int else -1
+
+
+def split_lines(text: str) -> List[str]:
+    """Split on '\\n' only, keeping line endings, so "".join() round-trips exactly"""
+    parts = (text or "").split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def compute_hunks(original: str, modified: str) -> List[dict]:
+    """Line-level hunks turning `original` into `modified`"""
+    old = split_lines(original)
+    new = split_lines(modified)
+
+    # Trim the common head and tail first; LLM edits usually touch a small window
+    head = 0
+    limit = min(len(old), len(new))
+    while head < limit and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    old_mid = old[head:len(old) - tail]
+    new_mid = new[head:len(new) - tail]
+
+    hunks = []
+    matcher = difflib.SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if hunks and hunks[-1]["old_start"] + hunks[-1]["old_count"] == head + i1:
+            # Adjacent replace/insert/delete opcodes form one hunk
+            hunks[-1]["old_count"] += i2 - i1
+            hunks[-1]["lines"].extend(new_mid[j1:j2])
+        else:
+            hunks.append({"old_start": head + i1, "old_count": i2 - i1, "lines": new_mid[j1:j2]})
+    return hunks
+
+
+def select_hunks(hunks: List[dict], accepted: Optional[List[int]] = None) -> List[dict]:
+    """Hunks the user accepted (all of them when `accepted` is None)"""
+    if accepted is None:
+        return list(hunks)
+    wanted = set(accepted)
+    return [hunk for index, hunk in enumerate(hunks) if index in wanted]
+
+
+def apply_hunks(base: str, hunks: List[dict], accepted: Optional[List[int]] = None,
+                base_hash: Optional[str] = None) -> str:
+    """Apply (a subset of) hunks to `base`, optionally verifying it against `base_hash`"""
+    if base_hash is not None and content_hash(base) != base_hash:
+        raise StaleBaseError("Base content changed since the diff was computed")
+    lines = split_lines(base)
+    # Apply bottom-up so earlier indexes stay valid
+    for hunk in sorted(select_hunks(hunks, accepted), key=lambda h: h["old_start"], reverse=True):
+        start, count = hunk["old_start"], hunk["old_count"]
+        if start < 0 or start + count > len(lines):
+            raise StaleBaseError(f"Hunk at line {start + 1} does not fit the base content")
+        lines[start:start + count] = hunk["lines"]
+    return "".join(lines)
+
+
+def build_edit_payload(original: str, modified: str) -> dict:
+    """Compact action_data fields describing an edit"""
+    hunks = compute_hunks(original, modified)
+    return {
+        "base_hash": content_hash(original),
+        "result_hash": content_hash(modified),
+        "hunks": hunks,
+        "stats": {
+            "hunks": len(hunks),
+            "added": sum(len(h["lines"]) for h in hunks),
+            "removed": sum(h["old_count"] for h in hunks),
+        },
+    }
@@ -0,0 +1,109 @@
+"""
+WillOfCode: File Content Cache
+LRU of file contents keyed by absolute path, validated against (mtime, size).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_entries = OrderedDict()    # abs path -> (mtime_ns, size, content)
+_total_bytes = 0
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+_watcher = None     # agent.watcher.Watcher, attached by start_watcher()
+
+
+def _key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def file_signature(path: str) -> Optional[tuple]:
+    """(mtime_ns, size) of a file, or None if it cannot be stat'ed"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def attach_watcher(watcher):
+    """With a reliable watcher, entries under watched dirs are trusted without a stat"""
+    global _watcher
+    _watcher = watcher
+
+
+def _trusted(key: str) -> bool:
+    watcher = _watcher
+    return watcher is not None and watcher.reliable and watcher.is_watched(os.path.dirname(key))
+
+
+def get(path: str) -> Optional[str]:
+    """Cached content if the file has not changed since it was cached"""
+    global _hits, _misses
+    key = _key(path)
+    if _trusted(key):
+        with _lock:
+            entry = _entries.get(key)
+            if entry:
+                _entries.move_to_end(key)
+                _hits += 1
+                return entry[2]
+    signature = file_signature(key)
+    with _lock:
+        entry = _entries.get(key)
+        if entry and signature and entry[:2] == signature:
+            _entries.move_to_end(key)
+            _hits += 1
+            return entry[2]
+        _misses += 1
+    return None
+
+
+def put(path: str, content: str, signature: Optional[tuple] = None):
+    """Cache content. Pass the signature taken *before* reading to avoid caching a torn read."""
+    global _total_bytes
+    key = _key(path)
+    signature = signature or file_signature(key)
+    if signature is None:
+        return
+    size = len(content)
+    if size > MAX_CACHE_BYTES // 4:
+        return
+    if _watcher is not None:
+        # Watch first, then re-check: any later change is guaranteed to invalidate us
+        _watcher.watch(os.path.dirname(key))
+        if file_signature(key) != signature:
+            return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old:
+            _total_bytes -= len(old[2])
+        _entries[key] = (signature[0], signature[1], content)
+        _total_bytes += size
+        while _total_bytes > MAX_CACHE_BYTES and _entries:
+            _, evicted = _entries.popitem(last=False)
+            _total_bytes -= len(evicted[2])
+
+
+def invalidate(path: str):
+    global _total_bytes
+    with _lock:
+        old = _entries.pop(_key(path), None)
+        if old:
+            _total_bytes -= len(old[2])
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+
+
+def stats() -> dict:
+    with _lock:
+        return {"entries": len(_entries), "bytes": _total_bytes, "hits": _hits, "misses": _misses}
@@ -0,0 +1,128 @@
+"""
+WillOfCode: Safe File Writes
+Writes go to a temp file in the target directory, are fsync'ed and then renamed
+over the target, so a crash never leaves a truncated file. Callers can pass the
+hash (or mtime) of the version they edited; a newer file on disk is never
+clobbered.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Iterable, List, Optional
+
+from agent.diffing import apply_hunks, split_lines, validate_hunks
+
+CHUNK_SIZE = 64 * 1024
+
+
+class WriteConflict(Exception):
+    """The file on disk is not the version the caller based its edit on"""
+
+    def __init__(self, path: str, current: Optional[dict]):
+        super().__init__(f"{path} was modified since it was read")
+        self.path = path
+        self.current = current
+
+
+def file_version(path: str) -> Optional[dict]:
+    """{"hash", "mtime_ns", "size"} of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return {"hash": digest.hexdigest(), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def check_expected(path: str, expected_hash: Optional[str] = None,
+                   expected_mtime_ns: Optional[int] = None) -> Optional[dict]:
+    """Raise WriteConflict unless the file still matches what the caller expects"""
+    if not expected_hash and expected_mtime_ns is None:
+        return None
+    current = file_version(path)
+    if expected_hash and (current is None or current["hash"] != expected_hash):
+        raise WriteConflict(path, current)
+    if expected_mtime_ns is not None and (current is None or current["mtime_ns"] != expected_mtime_ns):
+        raise WriteConflict(path, current)
+    return current
+
+
+def atomic_write(path: str, chunks: Iterable[bytes], expected_hash: Optional[str] = None,
+                 expected_mtime_ns: Optional[int] = None) -> dict:
+    """Stream chunks to a temp file, fsync, and rename over `path`. Returns the new version."""
+    # Write through symlinks like open(path, "w") does instead of replacing the link
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    check_expected(path, expected_hash, expected_mtime_ns)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            for chunk in chunks:
+                if chunk:
+                    tmp.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)   # mkstemp creates 0600
+        # Re-check right before the rename to keep the race window tiny
+        check_expected(path, expected_hash, expected_mtime_ns)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    return {"hash": digest.hexdigest(), "mtime_ns": os.stat(path).st_mtime_ns, "size": size}
+
+
+def text_chunks(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """atomic_write_text's newline handling for streamed UTF-8 text: b'\n' becomes os.linesep"""
+    if os.linesep == "\n":
+        return chunks
+    linesep = os.linesep.encode("ascii")
+    # b'\n' never occurs inside a multi-byte UTF-8 sequence, so chunks can be translated independently
+    return (chunk.replace(b"\n", linesep) for chunk in chunks)
+
+
+def atomic_write_text(path: str, content: str, expected_hash: Optional[str] = None,
+                      expected_mtime_ns: Optional[int] = None) -> dict:
+    """Same newline handling as open(path, "w"): '\n' becomes os.linesep"""
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    data = content.encode("utf-8")
+    chunks = (data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    return atomic_write(path, chunks, expected_hash, expected_mtime_ns)
+
+
+def write_patch(path: str, hunks: List[dict], base_hash: str) -> dict:
+    """Apply line hunks (see agent.diffing) to the file on disk, which must match base_hash"""
+    if not base_hash:
+        raise ValueError("base_hash is required in patch mode")
+    validate_hunks(hunks)
+    current = check_expected(path, expected_hash=base_hash)
+    with open(path, "r", encoding="utf-8") as f:
+        base = f.read()
+    # The base is verified, so hunks that do not fit it are the caller's mistake, not a conflict
+    validate_hunks(hunks, line_count=len(split_lines(base)))
+    content = apply_hunks(base, hunks)
+    return atomic_write_text(path, content, expected_hash=current["hash"])
@@ -8,9 +8,11 @@ from agent.state import WillOfCodeState
 from agent.supervisor import (
     supervisor_node, 
     should_need_approval, 
-    human_approval_node
+    human_approval_node,
+    memory_node
 )
 from agent.agents import coder_agent, reviewer_agent, debug_agent, file_agent
+from agent.tool_agent import tool_agent
 
 
 # Create the multi-agent graph
@@ -23,6 +25,8 @@ graph.add_node("coder", coder_agent)                    # Code generation agent
 graph.add_node("reviewer", reviewer_agent)              # Code review agent
 graph.add_node("debug", debug_agent)                    # Debug & explain agent
 graph.add_node("file", file_agent)                      # File operations agent
+graph.add_node("tools", tool_agent)                     # Model-driven MCP tool calls
+graph.add_node("memory", memory_node)                   # Records the turn in conversation memory
 graph.add_node("human_approval", human_approval_node)   # Human-in-the-loop
 
 
@@ -44,14 +48,19 @@ graph.add_conditional_edges(
         "reviewer": "reviewer",
         "debug": "debug",
         "file": "file",
+        "tools": "tools",
     }
 )
 
-# All agents can optionally go to human approval or end
-graph.add_conditional_edges("coder", should_need_approval, {"needs_approval": "human_approval", "no_approval": END})
-graph.add_conditional_edges("reviewer", should_need_approval, {"needs_approval": "human_approval", "no_approval": END})
-graph.add_conditional_edges("debug", should_need_approval, {"needs_approval": "human_approval", "no_approval": END})
-graph.add_conditional_edges("file", should_need_approval, {"needs_approval": "human_approval", "no_approval": END})
+# Every agent's answer is remembered before any approval pause
+graph.add_edge("coder", "memory")
+graph.add_edge("reviewer", "memory")
+graph.add_edge("debug", "memory")
+graph.add_edge("file", "memory")
+graph.add_edge("tools", "memory")
+
+# Then optionally go to human approval or end
+graph.add_conditional_edges("memory", should_need_approval, {"needs_approval": "human_approval", "no_approval": END})
 
 graph.add_edge("human_approval", END)
 
@@ -67,4 +76,5 @@ AVAILABLE_AGENTS = {
     "reviewer": "Reviews code quality, refactors, suggests improvements",
     "debug": "Debugs errors, explains code, traces issues",
     "file": "Reads files, lists directories, executes Python",
+    "tools": "Plans multi-step file tasks with the MCP tools (WOC_TOOL_AGENT=1)",
 }
@@ -0,0 +1,156 @@
+"""
+WillOfCode: Directory Listing
+scandir-based, paginated listings. Sorted entries are cached per directory and
+reused while the directory's mtime is unchanged; size/mtime are only stat'ed
+for the page being returned, and only when asked for.
+"""
+import base64
+import bisect
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+MAX_CACHED_DIRS = 128
+
+_cache = OrderedDict()      # abs dir -> (mtime_ns, keys, entries)
+_lock = threading.Lock()
+_watcher = None             # agent.watcher.Watcher, attached by start_watcher()
+
+
+def _scan(path: str) -> tuple:
+    """Sorted (keys, entries) for a directory: folders first, then case-insensitive name"""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                # Uses the cached d_type; only symlinks cost an extra stat
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            entries.append((not is_dir, entry.name.lower(), entry.name, entry.path))
+    entries.sort()
+    keys = [entry[:3] for entry in entries]
+    return keys, entries
+
+
+def attach_watcher(watcher):
+    """With a reliable watcher, listings of watched dirs are trusted without a stat"""
+    global _watcher
+    _watcher = watcher
+
+
+def _get_entries(path: str) -> tuple:
+    key = os.path.abspath(path)
+    watcher = _watcher
+    if watcher is not None and watcher.reliable and watcher.is_watched(key):
+        with _lock:
+            cached = _cache.get(key)
+            if cached:
+                _cache.move_to_end(key)
+                return cached[1], cached[2]
+    if watcher is not None:
+        watcher.watch(key)
+    mtime_ns = os.stat(key).st_mtime_ns
+    with _lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == mtime_ns:
+            _cache.move_to_end(key)
+            return cached[1], cached[2]
+    keys, entries = _scan(path)
+    if os.stat(key).st_mtime_ns != mtime_ns:
+        return keys, entries    # Changed while scanning, don't cache
+    with _lock:
+        _cache[key] = (mtime_ns, keys, entries)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_DIRS:
+            _cache.popitem(last=False)
+    return keys, entries
+
+
+def invalidate(path: str):
+    """Forget a cached listing (e.g. when a watcher reports a change)"""
+    with _lock:
+        _cache.pop(os.path.abspath(path), None)
+
+
+def encode_cursor(entry: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(entry[:3])).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        is_file, lower, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (bool(is_file), str(lower), str(name))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _matches(entry: tuple, extensions: Optional[set], include_hidden: bool, prefix: Optional[str]) -> bool:
+    is_file, lower, name, _ = entry
+    if not include_hidden and name.startswith("."):
+        return False
+    if prefix and not lower.startswith(prefix):
+        return False
+    if extensions and is_file and os.path.splitext(lower)[1] not in extensions:
+        return False    # Folders always pass so the tree stays navigable
+    return True
+
+
+def list_directory(path: str, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                   extensions: Optional[Iterable[str]] = None, include_hidden: bool = True,
+                   prefix: Optional[str] = None, fields: Iterable[str] = ()) -> dict:
+    """One page of a directory listing. Raises FileNotFoundError/NotADirectoryError/ValueError."""
+    if not os.path.isdir(path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        raise NotADirectoryError(path)
+
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if extensions:
+        extensions = {ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in extensions if ext}
+    prefix = prefix.lower() if prefix else None
+    fields = set(fields)
+
+    keys, entries = _get_entries(path)
+    start = bisect.bisect_right(keys, decode_cursor(cursor)) if cursor else 0
+
+    page = []
+    next_cursor = None
+    for index in range(start, len(entries)):
+        entry = entries[index]
+        if not _matches(entry, extensions, include_hidden, prefix):
+            continue
+        if len(page) == limit:
+            next_cursor = encode_cursor(page[-1])
+            break
+        page.append(entry)
+
+    items = []
+    for is_file, _, name, item_path in page:
+        item = {
+            'name': name,
+            'path': item_path,
+            'isDirectory': not is_file,
+            'extension': os.path.splitext(name)[1].lower()
+        }
+        if fields & {"size", "mtime"}:
+            try:
+                st = os.stat(item_path)
+            except OSError:
+                st = None
+            if "size" in fields:
+                item['size'] = st.st_size if st and is_file else None
+            if "mtime" in fields:
+                item['modified'] = st.st_mtime if st else None
+        items.append(item)
+
+    return {
+        'currentPath': path,
+        'parentPath': os.path.dirname(path),
+        'items': items,
+        'nextCursor': next_cursor,
+    }
@@ -1,47 +1,491 @@
 """
-LLM Module - Simple wrapper for Google Gemini
+LLM Module - Model registry with latency-aware provider routing
+
+Each request asks for a model *tier* ("fast" or "strong"). A tier maps to an
+ordered list of providers; the router tracks live latency and error rate per
+provider (EWMA) and tries the healthiest one first, failing over on errors.
+
+Configure tiers with comma-separated `provider:model` specs, e.g.
+    WOC_FAST_MODELS=gemini:gemini-2.5-flash-lite,local:qwen2.5-coder
+    WOC_STRONG_MODELS=gemini:gemini-2.5-flash,openai:gpt-4.1
+Providers: `gemini`, `openai` and `local` (any OpenAI-compatible endpoint,
+default http://localhost:8080/v1, override with WOC_LOCAL_BASE_URL).
 """
+import contextvars
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
+from agent.prompts import Prompt, as_prompt
+from agent.context_cache import get_context_cache
+from agent.singleflight import fingerprint, group
+from agent.structured import ResponseSchema, parse_json_response
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.2
-)
+
+DEFAULT_TIERS = {
+    "fast": "gemini:gemini-2.5-flash-lite",
+    "strong": "gemini:gemini-2.5-flash",
+}
+
+# Cheap explanations go to the fast tier, anything that rewrites code to the strong one
+INTENT_TIERS = {
+    "explain": "fast",
+    "documentation": "fast",
+    "code_review": "fast",
+    "debug": "strong",
+    "refactor": "strong",
+    "optimize": "strong",
+    "test_gen": "strong",
+    "generate": "strong",
+}
+
+EWMA_ALPHA = 0.3            # Weight of the newest sample
+ERROR_PENALTY = 4.0         # Score multiplier per unit of error rate
+FAILURE_COOLDOWN = 30.0     # Seconds a provider is deprioritised after consecutive failures
+COOLDOWN_AFTER = 3          # Consecutive failures before the cooldown kicks in
+MAX_REASKS = 1              # Follow-up calls for fields missing from a structured response
+
+
+# ============================================================================
+# PROVIDERS
+# ============================================================================
+class GeminiProvider:
+    """Google Gemini through langchain"""
+
+    def __init__(self, model: str):
+        self.name = f"gemini:{model}"
+        self.model = model
+        self._clients = {}      # (cached content name, response schema) -> client
+        self._lock = threading.Lock()
+
+    def _get_client(self, cache_name: str = None, json_schema: dict = None):
+        key = (cache_name, json.dumps(json_schema, sort_keys=True) if json_schema else None)
+        with self._lock:
+            if key not in self._clients:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                if len(self._clients) >= 32:
+                    self._clients.clear()
+                options = {}
+                if cache_name:
+                    options["cached_content"] = cache_name
+                if json_schema:
+                    # Gemini's schema dialect has no additionalProperties
+                    schema = {k: v for k, v in json_schema["schema"].items() if k != "additionalProperties"}
+                    options.update(response_mime_type="application/json", response_schema=schema)
+                self._clients[key] = ChatGoogleGenerativeAI(
+                    model=self.model,
+                    google_api_key=os.getenv("GOOGLE_API_KEY"),
+                    temperature=0.2,
+                    **options
+                )
+            return self._clients[key]
+
+    def complete(self, prompt: Prompt, json_schema: dict = None) -> str:
+        handle = get_context_cache().handle_for(self.model, prompt)
+        if handle and handle.backend == "gemini":
+            try:
+                # Prefix already lives provider-side, only send the query
+                response = self._get_client(handle.name, json_schema).invoke(prompt.suffix)
+                _record_message_usage(response, prompt)
+                return response.content.strip()
+            except Exception as e:
+                print(f"[LLM] Cached content {handle.name} unusable, sending full prompt: {e}")
+        client = self._get_client(json_schema=json_schema)
+        if prompt.prefix:
+            response = client.invoke([("system", prompt.prefix), ("human", prompt.suffix)])
+        else:
+            response = client.invoke(prompt.suffix)
+        _record_message_usage(response, prompt)
+        return response.content.strip()
+
+    def complete_with_tools(self, messages: list, tools: list, timeout: float = None) -> dict:
+        """One model turn over OpenAI-style messages; returns {"content", "tool_calls"}"""
+        # No per-call timeout through langchain; callers with a budget enforce their own deadline
+        from langchain_core.messages import convert_to_messages
+        client = self._get_client().bind_tools([{"type": "function", "function": tool} for tool in tools])
+        response = client.invoke(convert_to_messages(messages))
+        _record_message_usage(response, Prompt("tools", "", _messages_text(messages)))
+        content = response.content
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+        calls = []
+        for i, call in enumerate(response.tool_calls or []):
+            args = call.get("args") or {}
+            if not isinstance(args, dict):
+                args = {"_invalid_arguments": str(args)}
+            calls.append({"id": call.get("id") or f"call_{i}", "name": call["name"], "args": args})
+        return {"content": (content or "").strip(), "tool_calls": calls}
+
+
+class OpenAICompatibleProvider:
+    """OpenAI or any server speaking the OpenAI chat completions API (vLLM, llama.cpp, stubs)"""
+
+    def __init__(self, kind: str, model: str, base_url: str = None, api_key: str = None):
+        self.name = f"{kind}:{model}"
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.structured_output = True   # Cleared if the server rejects response_format
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key or "not-needed")
+        return self._client
+
+    def _create(self, messages: list, json_schema: dict = None):
+        options = {}
+        if json_schema and self.structured_output:
+            options["response_format"] = {"type": "json_schema", "json_schema": {**json_schema, "strict": True}}
+        try:
+            return self._get_client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.2,
+                **options
+            )
+        except Exception as e:
+            if not options or getattr(e, "status_code", None) != 400 or not _rejects_response_format(e):
+                raise
+            # Only give up on schemas for good once the same request works without one
+            response = self._create(messages)
+            print(f"[LLM] {self.name} rejected structured output, falling back to plain JSON prompts: {e}")
+            self.structured_output = False
+            return response
+
+    def complete(self, prompt: Prompt, json_schema: dict = None) -> str:
+        # A stable leading system message lets the server's prefix cache kick in
+        messages = [{"role": "user", "content": prompt.suffix}]
+        if prompt.prefix:
+            messages.insert(0, {"role": "system", "content": prompt.prefix})
+        response = self._create(messages, json_schema)
+        text = (response.choices[0].message.content or "").strip()
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_usage(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+        else:
+            record_usage(estimate_tokens(prompt.text()), estimate_tokens(text), estimated=True)
+        return text
+
+    def complete_with_tools(self, messages: list, tools: list, timeout: float = None) -> dict:
+        """One model turn over OpenAI-style messages; returns {"content", "tool_calls"}"""
+        options = {"timeout": timeout} if timeout is not None else {}
+        response = self._get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=[{"type": "function", "function": tool} for tool in tools],
+            temperature=0.2,
+            **options
+        )
+        message = response.choices[0].message
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_usage(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+        else:
+            record_usage(estimate_tokens(_messages_text(messages)), estimate_tokens(message.content or ""), estimated=True)
+        calls = []
+        for call in message.tool_calls or []:
+            try:
+                args = json.loads(call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                args = None
+            if not isinstance(args, dict):
+                args = {"_invalid_arguments": call.function.arguments}
+            calls.append({"id": call.id, "name": call.function.name, "args": args})
+        return {"content": (message.content or "").strip(), "tool_calls": calls}
+
+
+def _rejects_response_format(error: Exception) -> bool:
+    """A 400 about response_format itself, not about the prompt (context length, content)"""
+    text = f"{error} {getattr(error, 'body', '')}".lower()
+    return any(marker in text for marker in ("response_format", "json_schema", "structured output"))
+
+
+def _messages_text(messages: list) -> str:
+    return "\n".join(str(m.get("content") or "") for m in messages)
+
+
+def make_provider(spec: str):
+    """Build a provider from a `kind:model` spec"""
+    kind, _, model = spec.strip().partition(":")
+    if kind == "gemini":
+        return GeminiProvider(model)
+    if kind == "openai":
+        return OpenAICompatibleProvider(kind, model, os.getenv("OPENAI_BASE_URL"), os.getenv("OPENAI_API_KEY"))
+    if kind == "local":
+        base_url = os.getenv("WOC_LOCAL_BASE_URL", "http://localhost:8080/v1")
+        return OpenAICompatibleProvider(kind, model, base_url, os.getenv("WOC_LOCAL_API_KEY"))
+    raise ValueError(f"Unknown model provider '{kind}' in spec '{spec}'")
+
+
+# ============================================================================
+# TOKEN USAGE
+# ============================================================================
+_usage = contextvars.ContextVar("llm_usage", default=None)
+_call_log = contextvars.ContextVar("llm_call_log", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token) for providers that report no usage"""
+    return (len(text) + 3) // 4
+
+
+@contextmanager
+def track_usage():
+    """Accumulate token usage of every completion made in this context into the yielded dict"""
+    usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated": False}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def record_usage(input_tokens: int, output_tokens: int, estimated: bool = False):
+    usage = _usage.get()
+    if usage is None:
+        return
+    usage["calls"] += 1
+    usage["input_tokens"] += input_tokens
+    usage["output_tokens"] += output_tokens
+    usage["estimated"] = usage["estimated"] or estimated
+
+
+def _record_message_usage(response, prompt: Prompt):
+    """Usage from a langchain message, estimated when the provider does not report it"""
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata:
+        record_usage(metadata.get("input_tokens", 0), metadata.get("output_tokens", 0))
+    else:
+        record_usage(estimate_tokens(prompt.text()), estimate_tokens(str(response.content)), estimated=True)
 
 
-def llm_invoke(prompt: str) -> dict:
-    """Simple text completion"""
+@contextmanager
+def capture_calls():
+    """Collect every upstream completion made in this context (used by traffic capture)"""
+    calls = []
+    token = _call_log.set(calls)
     try:
-        response = llm.invoke(prompt)
-        return {"generate": response.content.strip()}
+        yield calls
+    finally:
+        _call_log.reset(token)
+
+
+def _log_call(kind: str, started: float, prompt_chars: int, output: str,
+              json_schema: dict = None, tool_calls: list = None):
+    calls = _call_log.get()
+    if calls is None:
+        return
+    calls.append({
+        "kind": kind,
+        "schema": json_schema["name"] if json_schema else None,
+        "latency": round(time.perf_counter() - started, 4),
+        "prompt_chars": prompt_chars,
+        "output": output,
+        "tool_calls": [call["name"] for call in tool_calls or []],
+    })
+
+
+# ============================================================================
+# HEALTH TRACKING
+# ============================================================================
+class ProviderStats:
+    """EWMA latency and error rate for one provider"""
+
+    def __init__(self):
+        self.latency = None         # Seconds, None until the first successful call
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+            if ok:
+                self.consecutive_failures = 0
+                self.latency = latency if self.latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+                )
+            else:
+                self.consecutive_failures += 1
+                self.last_failure = time.monotonic()
+
+    def score(self) -> float:
+        """Lower is better. Untried providers score 0 so they get probed once."""
+        with self._lock:
+            if (self.consecutive_failures >= COOLDOWN_AFTER
+                    and time.monotonic() - self.last_failure < FAILURE_COOLDOWN):
+                return float("inf")
+            if self.latency is None:
+                # Never succeeded: untried providers get probed, failing ones go last
+                return 0.0 if self.calls == 0 else FAILURE_COOLDOWN
+            return self.latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+                "error_rate_ewma": round(self.error_rate, 4),
+                "consecutive_failures": self.consecutive_failures,
+                "calls": self.calls,
+            }
+
+
+# ============================================================================
+# REGISTRY
+# ============================================================================
+_providers = {}     # spec -> provider
+_stats = {}         # spec -> ProviderStats
+_tiers = {}         # tier -> [spec, ...]
+_registry_lock = threading.Lock()
+
+
+def _tier_specs(tier: str) -> list:
+    with _registry_lock:
+        if tier not in _tiers:
+            raw = os.getenv(f"WOC_{tier.upper()}_MODELS") or DEFAULT_TIERS.get(tier) or DEFAULT_TIERS["strong"]
+            specs = [s.strip() for s in raw.split(",") if s.strip()]
+            for spec in specs:
+                if spec not in _providers:
+                    _providers[spec] = make_provider(spec)
+                    _stats[spec] = ProviderStats()
+            _tiers[tier] = specs
+        return _tiers[tier]
+
+
+def select_tier(intent: str, is_edit: bool = False) -> str:
+    """Pick the model tier for an intent; edits always get the strong tier"""
+    if is_edit:
+        return "strong"
+    return INTENT_TIERS.get(intent or "generate", "strong")
+
+
+def ranked_providers(tier: str) -> list:
+    """Providers for a tier, healthiest first (configured order breaks ties)"""
+    specs = _tier_specs(tier)
+    order = sorted(range(len(specs)), key=lambda i: (_stats[specs[i]].score(), i))
+    return [(specs[i], _providers[specs[i]]) for i in order]
+
+
+def provider_stats() -> dict:
+    """Live routing stats for every provider that has been configured"""
+    with _registry_lock:
+        return {
+            "tiers": {tier: list(specs) for tier, specs in _tiers.items()},
+            "providers": {spec: stats.snapshot() for spec, stats in _stats.items()},
+            "context_cache": get_context_cache().stats(),
+        }
+
+
+def _complete(prompt: Prompt, tier: str, json_schema: dict = None) -> str:
+    """Run a completion, sharing it with any identical completion already in flight"""
+    key = fingerprint(tier, prompt.prefix, prompt.suffix, json_schema)
+    return group("llm").do(key, lambda: _complete_uncoalesced(prompt, tier, json_schema))
+
+
+def _complete_uncoalesced(prompt: Prompt, tier: str, json_schema: dict = None) -> str:
+    started = time.perf_counter()
+    text = _with_failover(tier, lambda provider: provider.complete(prompt, json_schema))
+    _log_call("json" if json_schema else "text", started, len(prompt.prefix) + len(prompt.suffix), text, json_schema)
+    return text
+
+
+class BudgetExhausted(TimeoutError):
+    """The caller's deadline passed; says nothing about the provider's health"""
+
+
+def _with_failover(tier: str, call, deadline: float = None):
+    """
+    Run `call(provider)` on the best provider for the tier, failing over on errors.
+    With a `deadline` (time.monotonic()), no provider is tried after it and failures
+    once it has passed raise BudgetExhausted without counting against the provider.
+    """
+    last_error = None
+    for spec, provider in ranked_providers(tier):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise BudgetExhausted("time budget exhausted") from last_error
+        start = time.perf_counter()
+        try:
+            result = call(provider)
+        except Exception as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise BudgetExhausted("time budget exhausted") from e
+            _stats[spec].record(time.perf_counter() - start, ok=False)
+            print(f"[LLM] {spec} failed, trying next provider: {e}")
+            last_error = e
+            continue
+        _stats[spec].record(time.perf_counter() - start, ok=True)
+        return result
+    raise last_error or RuntimeError(f"No providers configured for tier '{tier}'")
+
+
+def llm_tool_turn(messages: list, tools: list, tier: str = "strong", deadline: float = None) -> dict:
+    """
+    One tool-calling model turn. `messages` are OpenAI-style chat messages and `tools`
+    are {"name", "description", "parameters"} specs. Returns {"content", "tool_calls"},
+    each call being {"id", "name", "args"}. Raises if every provider fails.
+    With a `deadline` (time.monotonic()), providers get the remaining time as their
+    request timeout and BudgetExhausted is raised once it has passed.
+    """
+    def call(provider):
+        if deadline is None:
+            return provider.complete_with_tools(messages, tools)
+        return provider.complete_with_tools(messages, tools, timeout=max(0.001, deadline - time.monotonic()))
+
+    started = time.perf_counter()
+    reply = _with_failover(tier, call, deadline)
+    _log_call("tools", started, len(_messages_text(messages)), reply["content"], tool_calls=reply["tool_calls"])
+    return reply
+
+
+def llm_invoke(prompt, tier: str = "strong") -> dict:
+    """Simple text completion (prompt may be a plain string or a Prompt)"""
+    try:
+        return {"generate": _complete(as_prompt(prompt), tier)}
     except Exception as e:
         return {"generate": f"Error: {e}"}
 
 
-def llm_invoke_json(prompt: str) -> dict:
-    """Get JSON response from LLM"""
+def llm_invoke_json(prompt, tier: str = "strong", schema: ResponseSchema = None) -> dict:
+    """
+    Get a JSON object from the LLM. With a schema, the provider's structured output
+    mode is used where available, and fields that are missing (or were cut off) are
+    asked for again on their own, up to MAX_REASKS times, instead of regenerating
+    everything. Failures return {"response": <reason>}.
+    """
     try:
-        json_prompt = f"{prompt}\n\nRespond ONLY with valid JSON, no markdown."
-        response = llm.invoke(json_prompt)
-        content = response.content.strip()
-        
-        # Clean markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-            content = content.strip()
-        
-        return json.loads(content)
-    except json.JSONDecodeError:
-        return {"response": "Could not parse JSON response"}
+        json_prompt = as_prompt(prompt).with_suffix("Respond ONLY with valid JSON, no markdown.")
+        parsed = parse_json_response(_complete(json_prompt, tier, schema.response_format() if schema else None))
+        if schema is None:
+            if parsed.data is None:
+                return {"response": "Could not parse JSON response"}
+            return parsed.data
+
+        result, missing = schema.validate(parsed.data)
+        for _ in range(MAX_REASKS):
+            if not missing:
+                break
+            print(f"[LLM] Response missing {missing}{' (truncated)' if parsed.truncated else ''}, asking for just those")
+            reask = as_prompt(prompt).with_suffix(
+                f"Your previous answer was incomplete. Respond ONLY with a JSON object containing "
+                f"these fields and nothing else: {', '.join(missing)}."
+            )
+            parsed = parse_json_response(_complete(reask, tier, schema.response_format(missing)))
+            found, _ = schema.validate(parsed.data)
+            result.update({k: v for k, v in found.items() if k in missing})
+            missing = [k for k in missing if k not in found]
+
+        if missing:
+            return {**result, "response": f"Incomplete JSON response, missing: {', '.join(missing)}"}
+        return result
     except Exception as e:
         return {"response": f"Error: {e}"}
@@ -1,7 +1,15 @@
-"""MCP Client"""
+"""MCP Client
+
+Tool calls go through one long-lived stdio session owned by a background event
+loop, instead of spawning the MCP server for every call.
+"""
 import os
 import asyncio
+import atexit
+import threading
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from agent.singleflight import fingerprint, group
 
 client = MultiServerMCPClient(
     {
@@ -13,31 +21,181 @@ client = MultiServerMCPClient(
     }
 )
 
+SESSION_STARTUP_TIMEOUT = 20.0   # Seconds to wait for the MCP server to come up
+
+# Read-only tools: concurrent identical calls can safely share one result
+IDEMPOTENT_TOOLS = {"read_file", "list_files"}
+# Tools that change files; in-flight reads of the same path must not be reused after them
+MUTATING_TOOLS = {"write_file", "delete_file"}
+
+
+def _format_result(result) -> str:
+    if isinstance(result, list):
+        return ''.join(item.get('text', '') for item in result if isinstance(item, dict)).strip()
+    return str(result)
+
 
 async def get_tools():
     return await client.get_tools()
 
 
-async def call_mcp_tool(tool_name: str, **kwargs):
+async def call_mcp_tool(tool_name: str, /, **kwargs):
+    """One-shot call on a fresh session (used when the pooled session is unavailable)"""
     tools = await get_tools()
     for tool in tools:
         if tool.name == tool_name:
             result = await tool.ainvoke(kwargs)
-            if isinstance(result, list):
-                return ''.join(item.get('text', '') for item in result if isinstance(item, dict)).strip()
-            return str(result)
+            return _format_result(result)
     return f"Tool '{tool_name}' not found"
 
 
-def call_mcp_tool_sync(tool_name: str, **kwargs):
-    return asyncio.run(call_mcp_tool(tool_name, **kwargs))
+# ============================================================================
+# POOLED SESSION
+# ============================================================================
+class MCPSessionPool:
+    """Keeps a single MCP session open on a dedicated event loop thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._holder = None         # Future of the task that owns the session
+        self._ready = None          # asyncio.Event, set once tools are loaded (or startup failed)
+        self._stop = None           # asyncio.Event, set to close the session
+        self._tools = None          # name -> tool bound to the live session
+        self.error = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="mcp-pool", daemon=True).start()
+            if self._holder is None or self._holder.done():
+                self._ready = asyncio.Event()
+                self._stop = asyncio.Event()
+                self._holder = asyncio.run_coroutine_threadsafe(
+                    self._hold_session(self._ready, self._stop), self._loop
+                )
+            return self._loop
+
+    async def _hold_session(self, ready: asyncio.Event, stop: asyncio.Event):
+        # The session's task group must be entered and exited by the same task
+        try:
+            async with client.session("file_ops") as session:
+                tools = await load_mcp_tools(session)
+                self._tools = {tool.name: tool for tool in tools}
+                self.error = None
+                ready.set()
+                await stop.wait()
+        except Exception as e:
+            self.error = e
+            print(f"[MCP] Pooled session failed: {e}")
+        finally:
+            self._tools = None
+            ready.set()
+
+    async def _call(self, tool_name: str, kwargs: dict):
+        await asyncio.wait_for(self._ready.wait(), SESSION_STARTUP_TIMEOUT)
+        tools = self._tools
+        if tools is None:
+            # Session is down, fall back to a one-shot session
+            return await call_mcp_tool(tool_name, **kwargs)
+        tool = tools.get(tool_name)
+        if tool is None:
+            return f"Tool '{tool_name}' not found"
+        return _format_result(await tool.ainvoke(kwargs))
+
+    def warm(self):
+        """Start the session in the background without waiting for it"""
+        self._ensure_started()
+
+    def submit(self, tool_name: str, /, **kwargs):
+        """Schedule a tool call; returns a concurrent.futures.Future (cancellable)"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._call(tool_name, kwargs), loop)
+
+    def tools(self) -> dict:
+        """Tools exposed by the live session (empty until it is ready)"""
+        return dict(self._tools or {})
+
+    def wait_ready(self, timeout: float = SESSION_STARTUP_TIMEOUT) -> dict:
+        """Start the session if needed and return its tools once loaded (empty on failure)"""
+        loop = self._ensure_started()
+        ready = self._ready
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(ready.wait(), timeout), loop).result(timeout + 1)
+        except Exception as e:
+            print(f"[MCP] Session not ready: {e}")
+        return self.tools()
+
+    def close(self):
+        with self._lock:
+            if self._loop is not None and self._stop is not None:
+                self._loop.call_soon_threadsafe(self._stop.set)
+
+
+pool = MCPSessionPool()
+atexit.register(pool.close)
+
+
+def warm_session():
+    pool.warm()
+
+
+def submit_mcp_tool(tool_name: str, /, **kwargs):
+    """Schedule a tool call; identical in-flight read-only calls are shared.
+    `tool_name` is positional-only so tool arguments can use any name."""
+    if tool_name in IDEMPOTENT_TOOLS:
+        key = fingerprint(tool_name, kwargs)
+        return group("mcp").submit(key, lambda: pool.submit(tool_name, **kwargs))
+    future = pool.submit(tool_name, **kwargs)
+    if tool_name in MUTATING_TOOLS and "path" in kwargs:
+        # Reads started before the change completes must not be handed to later callers
+        _forget_reads(kwargs["path"])
+        future.add_done_callback(lambda _: _forget_reads(kwargs["path"]))
+    return future
+
+
+def _forget_reads(path: str):
+    flights = group("mcp")
+    flights.forget(fingerprint("read_file", {"path": path}))
+    flights.forget(fingerprint("list_files", {"directory": os.path.dirname(path)}))
+
+
+def call_mcp_tool_sync(tool_name: str, /, **kwargs):
+    try:
+        return submit_mcp_tool(tool_name, **kwargs).result()
+    except Exception as e:
+        # Not retried: tools like run_python are not safe to execute twice
+        return f"ERROR: {e}"
+
+
+# Shown when the MCP server cannot be reached
+FALLBACK_TOOLS = [
+    {"name": "read_file", "description": "Read contents of a file", "params": ["path"]},
+    {"name": "write_file", "description": "Write content to a file", "params": ["path", "content"]},
+    {"name": "delete_file", "description": "Delete a file", "params": ["path"]},
+    {"name": "list_files", "description": "List files in a directory", "params": ["directory"]},
+    {"name": "run_python", "description": "Execute Python code", "params": ["code"]}
+]
+
+
+def tool_specs() -> list:
+    """{"name", "description", "parameters"} (JSON schema) for every tool the server exposes"""
+    specs = []
+    for name, tool in sorted(pool.wait_ready().items()):
+        schema = tool.args_schema if isinstance(tool.args_schema, dict) else tool.args_schema.model_json_schema()
+        parameters = {k: v for k, v in schema.items() if k in ("type", "properties", "required")}
+        specs.append({"name": name, "description": (tool.description or "").strip(), "parameters": parameters})
+    return specs
 
 
 def list_mcp_tools():
+    """Tools discovered from the MCP server (static list if it is unavailable)"""
+    specs = tool_specs()
+    if not specs:
+        return FALLBACK_TOOLS
     return [
-        {"name": "read_file", "description": "Read contents of a file", "params": ["path"]},
-        {"name": "write_file", "description": "Write content to a file", "params": ["path", "content"]},
-        {"name": "delete_file", "description": "Delete a file", "params": ["path"]},
-        {"name": "list_files", "description": "List files in a directory", "params": ["directory"]},
-        {"name": "run_python", "description": "Execute Python code", "params": ["code"]}
+        {"name": spec["name"], "description": spec["description"].splitlines()[0] if spec["description"] else "",
+         "params": list(spec["parameters"].get("properties", {}))}
+        for spec in specs
     ]
@@ -0,0 +1,143 @@
+"""
+WillOfCode: Conversation Memory
+Per-thread history kept in the graph state (and so in the checkpointer): the
+last MAX_TURNS turns verbatim plus a rolling summary of everything older.
+
+Older turns are folded into the summary by a background job on the fast tier,
+never on the request path. Until a fold lands, the turns it covers are simply
+left out of prompts. What gets injected into agent prompts is capped at
+HISTORY_TOKEN_CAP tokens: oldest verbatim turns go first, then the summary is
+truncated.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from agent.llm import llm_invoke, estimate_tokens
+from agent.prompts import summary_prompt
+
+MAX_TURNS = int(os.getenv("WOC_MEMORY_TURNS", "4"))                 # Verbatim turns kept
+HISTORY_TOKEN_CAP = int(os.getenv("WOC_MEMORY_TOKEN_CAP", "1500"))  # Injected history budget
+TURN_CHARS = 2000           # Longest stored user message / answer, per turn
+SUMMARY_CHARS = 3000        # Longest rolling summary
+MAX_PENDING_TURNS = MAX_TURNS * 4   # Turns kept while their fold is pending or failing
+
+MAX_UNCOLLECTED = 1000      # Finished summaries kept for threads that have not come back yet
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+_folds = {}                 # thread id -> Future of a running fold
+_finished = OrderedDict()   # thread id -> (summary, last folded turn id), until the next turn
+_lock = threading.Lock()
+
+
+def _clip(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit] + " …[truncated]"
+
+
+def thread_id_of(config) -> str:
+    return ((config or {}).get("configurable") or {}).get("thread_id", "default")
+
+
+# ============================================================================
+# SUMMARIZATION (background)
+# ============================================================================
+def _fold(summary: str, turns: List[dict]) -> tuple:
+    result = llm_invoke(summary_prompt(summary, turns), tier="fast")["generate"]
+    if result.startswith("Error"):
+        raise RuntimeError(result)
+    return _clip(result, SUMMARY_CHARS), turns[-1]["id"]
+
+
+def _fold_done(thread_id: str, future):
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"[MEMORY] Summary for thread {thread_id} failed, will retry: {e}")
+        result = None
+    with _lock:
+        _folds.pop(thread_id, None)
+        if result is not None:
+            _finished[thread_id] = result
+            # Threads that never return must not pin their summaries forever
+            while len(_finished) > MAX_UNCOLLECTED:
+                _finished.popitem(last=False)
+
+
+def _schedule_fold(thread_id: str, summary: str, turns: List[dict]):
+    with _lock:
+        if thread_id in _folds or thread_id in _finished:
+            return  # One fold per thread until it is collected; the next turn schedules the rest
+        future = _executor.submit(_fold, summary, turns)
+        _folds[thread_id] = future
+    future.add_done_callback(lambda done: _fold_done(thread_id, done))
+
+
+def _collect_fold(thread_id: str) -> Optional[tuple]:
+    """(summary, last folded turn id) of a finished fold for this thread, if any"""
+    with _lock:
+        return _finished.pop(thread_id, None)
+
+
+# ============================================================================
+# STATE UPDATES
+# ============================================================================
+def apply_summary(state: dict, thread_id: str) -> dict:
+    """State updates for a fold that finished since the last turn (empty if none)"""
+    folded = _collect_fold(thread_id)
+    if folded is None:
+        return {}
+    summary, last_id = folded
+    turns = [t for t in (state.get("turns") or []) if t["id"] > last_id]
+    return {"summary": summary, "turns": turns}
+
+
+def record_turn(state: dict, thread_id: str) -> dict:
+    """Append this turn and start folding whatever no longer fits verbatim"""
+    turn_id = (state.get("turn_count") or 0) + 1
+    turns = list(state.get("turns") or [])
+    turns.append({
+        "id": turn_id,
+        "agent": state.get("current_agent"),
+        "user": _clip(state.get("user_query"), TURN_CHARS),
+        "assistant": _clip(state.get("llm_result"), TURN_CHARS),
+    })
+    # Folds that keep failing must not let the state grow without bound
+    turns = turns[-MAX_PENDING_TURNS:]
+    overflow = turns[:-MAX_TURNS]
+    if overflow:
+        _schedule_fold(thread_id, state.get("summary") or "", overflow)
+    return {"turns": turns, "turn_count": turn_id}
+
+
+# ============================================================================
+# PROMPT INJECTION
+# ============================================================================
+def _format_turn(turn: dict) -> str:
+    return f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+
+
+def history_for_prompt(state: dict, token_cap: int = HISTORY_TOKEN_CAP) -> str:
+    """Summary + recent turns as prompt text, never more than `token_cap` tokens"""
+    summary = state.get("summary") or ""
+    recent = [_format_turn(t) for t in (state.get("turns") or [])[-MAX_TURNS:]]
+    if not summary and not recent:
+        return ""
+
+    def render(summary_text, turns):
+        parts = []
+        if summary_text:
+            parts.append(f"Summary of the earlier conversation:\n{summary_text}")
+        if turns:
+            parts.append("Recent turns:\n" + "\n\n".join(turns))
+        return "\n\n".join(parts)
+
+    text = render(summary, recent)
+    while recent and estimate_tokens(text) > token_cap:
+        recent.pop(0)
+        text = render(summary, recent)
+    if estimate_tokens(text) > token_cap:
+        text = text[:token_cap * 4]
+    return text
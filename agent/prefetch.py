@@ -0,0 +1,74 @@
+"""
+WillOfCode: Speculative File Prefetch
+The supervisor starts reading any file named in the query while it routes, so
+the chosen agent finds the content ready instead of paying the MCP round trip.
+"""
+import os
+import threading
+
+from agent import file_cache
+from agent.mcp_client import submit_mcp_tool, call_mcp_tool_sync
+
+PREFETCH_WAIT_TIMEOUT = 30.0    # Seconds an agent waits on an in-flight speculative read
+
+_inflight = {}      # abs path -> Future of the MCP read_file call
+_lock = threading.Lock()
+
+
+def _key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def prefetch_file(path: str) -> bool:
+    """Start a speculative read of `path`. Returns True if the file is (or will be) cached."""
+    if not path or path == "." or not os.path.isfile(path):
+        return False
+    if file_cache.get(path) is not None:
+        return True
+    key = _key(path)
+    with _lock:
+        if key in _inflight:
+            return True
+        signature = file_cache.file_signature(key)
+        future = submit_mcp_tool("read_file", path=path)
+        _inflight[key] = future
+
+    def _store(done):
+        with _lock:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+        if done.cancelled() or done.exception() is not None:
+            return
+        content = done.result()
+        if content and not content.startswith("ERROR"):
+            file_cache.put(key, content, signature)
+
+    future.add_done_callback(_store)
+    return True
+
+
+def cancel_prefetch(path: str):
+    """Drop a speculative read nobody is going to use"""
+    with _lock:
+        future = _inflight.pop(_key(path), None)
+    if future is not None:
+        future.cancel()
+
+
+def read_file_cached(path: str) -> str:
+    """Read a file via the cache, an in-flight prefetch, or MCP (in that order)"""
+    content = file_cache.get(path)
+    if content is not None:
+        return content
+    with _lock:
+        future = _inflight.get(_key(path))
+    if future is not None:
+        try:
+            return future.result(timeout=PREFETCH_WAIT_TIMEOUT)
+        except Exception:
+            pass    # Cancelled or failed speculation, read it ourselves
+    signature = file_cache.file_signature(path)
+    content = call_mcp_tool_sync("read_file", path=path)
+    if content and not content.startswith("ERROR"):
+        file_cache.put(path, content, signature)
+    return content
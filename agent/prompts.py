@@ -0,0 +1,158 @@
+"""
+WillOfCode: Prompt Templates
+Every prompt is split into a stable prefix (instructions + file context) and a
+volatile suffix (the user's request). The prefix only changes when the file
+changes, so providers can reuse it across turns.
+"""
+import hashlib
+from typing import NamedTuple
+
+
+def content_hash(text: str) -> str:
+    """Stable hash for file contents and prompt prefixes"""
+    return hashlib.sha256((text or "").encode("utf-8", errors="replace")).hexdigest()
+
+
+class Prompt(NamedTuple):
+    agent: str          # Template name, e.g. "coder.edit"
+    prefix: str         # Stable: instructions + file context
+    suffix: str         # Volatile: the user query
+    file_hash: str = ""
+
+    @property
+    def prefix_hash(self) -> str:
+        return content_hash(self.prefix)
+
+    def text(self) -> str:
+        """Flat prompt for providers without message roles"""
+        if not self.prefix:
+            return self.suffix
+        return f"{self.prefix}\n\n{self.suffix}"
+
+    def with_suffix(self, extra: str) -> "Prompt":
+        return self._replace(suffix=f"{self.suffix}\n\n{extra}")
+
+
+def with_history(suffix: str, history: str = "") -> str:
+    """Prepend conversation history (see agent.memory) to a prompt suffix"""
+    if not history:
+        return suffix
+    return f"Conversation so far:\n{history}\n\n{suffix}"
+
+
+def as_prompt(prompt) -> Prompt:
+    """Accept plain strings wherever a Prompt is expected"""
+    if isinstance(prompt, Prompt):
+        return prompt
+    return Prompt(agent="", prefix="", suffix=prompt)
+
+
+# ============================================================================
+# CODER
+# ============================================================================
+def coder_edit_prompt(query: str, file_content: str, history: str = "") -> Prompt:
+    prefix = f"""You are editing a file. Make ONLY the requested change.
+CRITICAL: Return the COMPLETE file content with your modification applied.
+Do NOT omit any existing code - include EVERY line from the original file.
+
+Return JSON format:
+{{"modified_code": "THE COMPLETE FILE WITH ALL ORIGINAL LINES PLUS YOUR CHANGE", "changes": "brief description of what you changed"}}
+
+COMPLETE ORIGINAL FILE:
+```
+{file_content}
+```"""
+    suffix = f"""User request: {query}
+
+Remember: Return the ENTIRE file content, not just the changed parts."""
+    return Prompt("coder.edit", prefix, with_history(suffix, history), content_hash(file_content))
+
+
+def coder_generate_prompt(query: str, history: str = "") -> Prompt:
+    prefix = """You are an expert Code Generation Agent.
+Your specialty is writing clean, efficient, and well-documented code.
+
+Instructions:
+- Generate high-quality code that solves the user's request
+- Include helpful comments
+- Follow best practices for the language"""
+    suffix = f"""User Request: {query}
+
+Provide your response:"""
+    return Prompt("coder.generate", prefix, with_history(suffix, history))
+
+
+# ============================================================================
+# REVIEWER
+# ============================================================================
+def reviewer_refactor_prompt(query: str, code: str, history: str = "") -> Prompt:
+    prefix = f"""You are refactoring code. Return the COMPLETE refactored file.
+
+Return JSON format:
+{{"refactored_code": "THE COMPLETE REFACTORED CODE", "changes": ["change1", "change2"]}}
+
+ORIGINAL CODE:
+```
+{code}
+```"""
+    suffix = f"User request: {query}"
+    return Prompt("reviewer.refactor", prefix, with_history(suffix, history), content_hash(code))
+
+
+def reviewer_review_prompt(query: str, code: str, history: str = "") -> Prompt:
+    prefix = f"""You are an expert Code Review Agent.
+Your specialty is analyzing code quality and suggesting improvements.
+
+Instructions:
+- Analyze code quality, readability, and maintainability
+- Identify potential bugs or issues
+- Suggest specific improvements with examples
+- Rate the code quality (1-10)
+
+Code to Review:
+{code if code else "No code provided for review."}"""
+    suffix = f"""User Request: {query}
+
+Provide your detailed review:"""
+    return Prompt("reviewer.review", prefix, with_history(suffix, history), content_hash(code))
+
+
+# ============================================================================
+# DEBUG
+# ============================================================================
+def debug_prompt(query: str, code: str, history: str = "") -> Prompt:
+    prefix = f"""You are an expert Debug & Analysis Agent.
+Your specialty is finding bugs, explaining code, and solving errors.
+
+Instructions:
+- If debugging: identify the bug, explain why it happens, and provide the fix
+- If explaining: break down the code logic clearly for all skill levels
+- Provide step-by-step analysis
+- Include fixed code if applicable
+
+Code to Analyze:
+{code if code else "No code provided."}"""
+    suffix = f"""User Request: {query}
+
+Provide your analysis:"""
+    return Prompt("debug", prefix, with_history(suffix, history), content_hash(code))
+
+
+# ============================================================================
+# MEMORY
+# ============================================================================
+def summary_prompt(summary: str, turns: list) -> Prompt:
+    prefix = """You maintain a running summary of a conversation between a developer and a coding assistant.
+Merge the previous summary and the new turns into one updated summary.
+Keep: files and functions discussed, decisions made, code changes applied or rejected, open questions.
+Drop: pleasantries, full code listings (mention what the code does instead).
+Write at most 200 words of plain text."""
+    new_turns = "\n\n".join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in turns)
+    suffix = f"""Previous summary:
+{summary or "(none)"}
+
+New turns:
+{new_turns}
+
+Updated summary:"""
+    return Prompt("memory.summary", prefix, suffix)
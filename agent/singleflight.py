@@ -0,0 +1,162 @@
+"""
+WillOfCode: Single-Flight Request Coalescing
+Identical calls that overlap in time share one upstream call. A double-submit
+or several users asking for the same review while the first call is still
+running wait on that call instead of issuing their own.
+
+Nothing is cached once the call finishes; a later identical call runs again.
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable
+
+
+def fingerprint(*parts) -> str:
+    """Stable key for a call: sha256 over the JSON encoding of its parts"""
+    raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8", errors="replace")).hexdigest()
+
+
+class _Call:
+    """A blocking call in progress; followers wait on `done`"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    """An upstream Future shared by `waiters` caller Futures"""
+
+    def __init__(self, upstream: Future):
+        self.upstream = upstream
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.RLock()
+        self._calls = {}       # key -> _Call
+        self._flights = {}     # key -> _Flight
+        self.calls = 0          # Calls that went upstream
+        self.deduped = 0        # Calls that joined one already in flight
+        self.cancelled = 0      # Upstream calls cancelled because every waiter left
+
+    def do(self, key: str, fn: Callable):
+        """Run `fn()` unless an identical call is running; then wait for its result (or error)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.deduped += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Future:
+        """
+        Future-based variant: `start()` launches the upstream call. Each caller gets
+        its own Future; cancelling it detaches that caller, and the upstream call is
+        only cancelled once every caller has gone.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.upstream.cancelled():
+                flight = self._flights[key] = _Flight(start())
+                self.calls += 1
+                flight.upstream.add_done_callback(lambda _: self._finish(key, flight))
+            else:
+                self.deduped += 1
+            flight.waiters += 1
+
+        waiter = Future()   # Stays pending until the upstream call settles, so it is always cancellable
+
+        def _copy(upstream: Future):
+            try:
+                if upstream.cancelled():
+                    waiter.cancel()
+                elif upstream.exception() is not None:
+                    waiter.set_exception(upstream.exception())
+                else:
+                    waiter.set_result(upstream.result())
+            except InvalidStateError:
+                pass    # This caller already cancelled
+
+        def _detach(done: Future):
+            if done.cancelled():
+                self._leave(key, flight)
+
+        waiter.add_done_callback(_detach)
+        flight.upstream.add_done_callback(_copy)
+        return waiter
+
+    def _leave(self, key: str, flight: _Flight):
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters > 0 or flight.upstream.done():
+                return
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if flight.upstream.cancel():
+            with self._lock:
+                self.cancelled += 1
+
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def forget(self, key: str):
+        """Stop handing out an in-flight result, e.g. after a write made it stale"""
+        with self._lock:
+            self._calls.pop(key, None)
+            self._flights.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "deduped": self.deduped,
+                "cancelled": self.cancelled,
+                "in_flight": len(self._calls) + len(self._flights),
+            }
+
+
+_groups = {}        # name -> SingleFlight
+_groups_lock = threading.Lock()
+
+
+def group(name: str) -> SingleFlight:
+    """Process-wide single-flight group by name (e.g. "llm", "mcp")"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def singleflight_stats() -> dict:
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: g.stats() for name, g in groups.items()}
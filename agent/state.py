@@ -24,4 +24,10 @@ class WillOfCodeState(TypedDict):
     pending_action: Optional[str]
     action_data: Optional[dict]
     
-    mcp_logs: Optional[List[str]]
\ No newline at end of file
+    mcp_logs: Optional[List[str]]
+    tool_mode: Optional[bool]             # File requests go to the tool-calling agent
+    
+    # Conversation memory (see agent/memory.py)
+    turns: Optional[List[dict]]           # Recent turns, verbatim
+    summary: Optional[str]                # Rolling summary of older turns
+    turn_count: Optional[int]
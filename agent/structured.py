@@ -0,0 +1,176 @@
+"""
+WillOfCode: Structured LLM Output
+Typed schemas for the JSON responses agents ask for, a tolerant parser that
+recovers JSON from fenced, chatty or truncated model output, and validation that
+reports exactly which fields are missing so only those are asked for again.
+"""
+import json
+import typing
+from typing import List, NamedTuple, Optional, TypedDict
+
+
+class EditResponse(TypedDict):
+    modified_code: str      # The complete file with the change applied
+    changes: str            # Short description of the change
+
+
+class RefactorResponse(TypedDict):
+    refactored_code: str
+    changes: List[str]
+
+
+def _json_type(annotation) -> dict:
+    if annotation is str:
+        return {"type": "string"}
+    if typing.get_origin(annotation) in (list, List):
+        (item,) = typing.get_args(annotation)
+        return {"type": "array", "items": _json_type(item)}
+    raise TypeError(f"Unsupported schema field type: {annotation}")
+
+
+class ResponseSchema(NamedTuple):
+    name: str
+    type: type      # A TypedDict
+
+    @property
+    def fields(self) -> dict:
+        return typing.get_type_hints(self.type)
+
+    def json_schema(self, only: Optional[List[str]] = None) -> dict:
+        fields = {k: v for k, v in self.fields.items() if only is None or k in only}
+        return {
+            "type": "object",
+            "properties": {k: _json_type(v) for k, v in fields.items()},
+            "required": list(fields),
+            "additionalProperties": False,
+        }
+
+    def response_format(self, only: Optional[List[str]] = None) -> dict:
+        """{"name", "schema"} as passed to providers' structured output modes"""
+        name = self.name if only is None else f"{self.name}_{'_'.join(only)}"
+        return {"name": name, "schema": self.json_schema(only)}
+
+    def validate(self, data) -> tuple:
+        """(fields that are present and usable, names of missing required fields)"""
+        if not isinstance(data, dict):
+            return {}, list(self.fields)
+        clean, missing = {}, []
+        for name, annotation in self.fields.items():
+            value = data.get(name)
+            if annotation is str and isinstance(value, list):
+                value = "\n".join(str(v) for v in value)
+            elif annotation is not str and isinstance(value, str):
+                value = [value]     # A list field answered with a single string
+            if value is None or value == "" or value == []:
+                missing.append(name)
+            else:
+                clean[name] = value
+        return clean, missing
+
+
+EDIT_SCHEMA = ResponseSchema("edit_response", EditResponse)
+REFACTOR_SCHEMA = ResponseSchema("refactor_response", RefactorResponse)
+
+
+# ============================================================================
+# TOLERANT PARSING
+# ============================================================================
+class ParsedJSON(NamedTuple):
+    data: Optional[dict]
+    truncated: bool = False     # Output was cut off; the last field is unreliable
+
+
+def _close_truncated(text: str) -> Optional[tuple]:
+    """
+    Close the strings/brackets of JSON that was cut off mid-stream.
+    Returns (closed text, whether the last top-level field was cut mid-value).
+    """
+    stack = []
+    in_string = escaped = False
+    string_start = 0
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            string_start = i
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not stack:
+                return None
+            stack.pop()
+    if not stack:
+        return None     # Balanced but unparseable: not a truncation problem
+
+    partial = len(stack) > 1    # Cut inside a nested value
+    if in_string:
+        if escaped:
+            text = text[:-1]
+        before = text[:string_start].rstrip()
+        if len(stack) == 1 and before.endswith((",", "{")):
+            text = before.rstrip(",")   # Cut inside a key: drop it
+        else:
+            text += '"'
+            partial = True
+    else:
+        text = text.rstrip().rstrip(",")
+        if text.endswith(":"):
+            text += " null"
+            partial = True
+        elif len(stack) == 1 and text.endswith('"'):
+            before = text[:text.rfind('"', 0, len(text) - 1)].rstrip()
+            if before.endswith((",", "{")):
+                text = before.rstrip(",")   # Complete key without a value: drop it
+        elif not text.endswith(('"', "}", "]")):
+            partial = True      # A number or literal may have been cut
+    return text + "".join(reversed(stack)), partial
+
+
+def parse_json_response(text: str) -> ParsedJSON:
+    """
+    Best-effort JSON object from model output: plain JSON, JSON inside markdown
+    fences or surrounded by prose (code containing ``` is fine), or truncated JSON.
+    """
+    text = (text or "").strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return ParsedJSON(data)
+    except json.JSONDecodeError:
+        pass
+
+    # Decode from the first '{' and ignore whatever follows (closing fence, chatter)
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    if start < 0:
+        return ParsedJSON(None)
+    try:
+        data, _ = decoder.raw_decode(text, start)
+        if isinstance(data, dict):
+            return ParsedJSON(data)
+    except json.JSONDecodeError:
+        pass
+
+    body = text[start:].rstrip()
+    if body.endswith("```"):
+        body = body[:-3].rstrip()   # Fence closed after a truncated body
+    closed = _close_truncated(body)
+    if closed is None:
+        return ParsedJSON(None)
+    repaired, partial = closed
+    try:
+        data = json.loads(repaired)
+    except json.JSONDecodeError:
+        return ParsedJSON(None)
+    if not isinstance(data, dict):
+        return ParsedJSON(None)
+    if partial and data:
+        # The field being written when the output stopped is incomplete
+        data.pop(list(data)[-1])
+    return ParsedJSON(data, truncated=True)
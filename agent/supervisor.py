@@ -2,8 +2,14 @@
 WillOfCode: Supervisor Agent
 Routes user requests using keyword-based intent detection (MCP style)
 """
+import os
 from agent.state import WillOfCodeState
-from agent.agents import AGENTS, get_agent
+from agent.agents import AGENTS, get_agent, extract_path_from_query
+from agent.prefetch import prefetch_file, cancel_prefetch, read_file_cached
+from agent.diffing import apply_hunks, StaleBaseError
+from agent.prompts import content_hash
+from agent.mcp_client import warm_session
+from agent.memory import apply_summary, record_turn, thread_id_of
 
 
 # Keyword-based intent detection for efficient routing
@@ -47,6 +53,12 @@ INTENT_TO_AGENT = {
     "documentation": "coder",
 }
 
+# File requests are planned by the model with the MCP tools (agent/tool_agent.py)
+TOOL_AGENT = os.getenv("WOC_TOOL_AGENT", "0") == "1"
+
+# Intents whose agent never needs the content of the file named in the query
+NO_CONTENT_INTENTS = {"folder_list", "file_delete", "file_write", "run_python"}
+
 
 def detect_intent(query: str) -> str:
     """Detect intent using keyword matching (MCP style)"""
@@ -62,45 +74,82 @@ def get_agent_for_intent(intent: str) -> str:
     return INTENT_TO_AGENT.get(intent, "coder")
 
 
-def supervisor_node(state: WillOfCodeState) -> WillOfCodeState:
+def supervisor_node(state: WillOfCodeState, config=None) -> WillOfCodeState:
     """
     Supervisor Agent: Routes to the best agent using keyword matching
     Fast and efficient - no LLM call needed for routing
     """
     query = state["user_query"]
     
+    # Speculatively read any file the query names while we route
+    path = extract_path_from_query(query)
+    speculating = prefetch_file(path)
+    
     # Detect intent using keywords
     intent = detect_intent(query)
     
     # Map intent to agent
     selected_agent = get_agent_for_intent(intent)
+    if selected_agent == "file" and (TOOL_AGENT or state.get("tool_mode")):
+        selected_agent = "tools"
+    
+    if speculating:
+        # Editor content wins over a named file for the content agents
+        has_editor_content = bool(state.get("file_content")) and selected_agent not in ("file", "tools")
+        if intent in NO_CONTENT_INTENTS or has_editor_content:
+            cancel_prefetch(path)
+    elif selected_agent in ("file", "tools"):
+        warm_session()
     
     return {
         **state,
+        **apply_summary(state, thread_id_of(config)),   # Fold finished since the last turn
         "current_agent": selected_agent,
         "intent": intent,
     }
 
 
+def memory_node(state: WillOfCodeState, config=None) -> WillOfCodeState:
+    """Record the finished turn in the thread's conversation memory"""
+    return {
+        **state,
+        **record_turn(state, thread_id_of(config)),
+    }
+
+
 def should_need_approval(state: WillOfCodeState) -> str:
     """
     Determines if human approval is needed based on the action
     """
     pending = state.get("pending_action")
     # Trigger approval for code edits (shown in diff modal)
-    if pending in ["stream_to_editor", "file_edit", "run_python", "delete"]:
+    if pending in ["stream_to_editor", "file_edit", "run_python", "delete", "write_file"]:
         return "needs_approval"
     return "no_approval"
 
 
+def _resolve_edit_base(state: WillOfCodeState, data: dict):
+    """Find the content an edit's hunks were computed against (editor buffer or file on disk)"""
+    base_hash = data.get("base_hash")
+    candidates = [state.get("file_content")]
+    path = data.get("path")
+    if path and os.path.isfile(path):
+        candidates.append(read_file_cached(path))
+    for candidate in candidates:
+        if candidate is not None and content_hash(candidate) == base_hash:
+            return candidate
+    return None
+
+
 def human_approval_node(state: WillOfCodeState) -> WillOfCodeState:
     """
     Human-in-the-loop approval node
+    Resume value: "accept"/"reject" or {"approved": bool, "accepted": [hunk indexes]}
     """
     from langgraph.types import interrupt
     
     action = state.get("pending_action", "unknown")
-    data = state.get("action_data", {})
+    data = state.get("action_data", {}) or {}
     
     # Create approval request
     approval_request = {
@@ -111,14 +160,37 @@ def human_approval_node(state: WillOfCodeState) -> WillOfCodeState:
     
     # Interrupt for human input
     human_response = interrupt(approval_request)
+    if isinstance(human_response, str):
+        human_response = {"approved": human_response == "accept"}
     
-    if human_response.get("approved", False):
+    if not human_response.get("approved", False):
         return {
             **state,
-            "llm_result": state.get("llm_result", "") + "\n[Action approved and executed]"
+            "llm_result": "[Action rejected by user]"
         }
-    else:
+    
+    if data.get("hunks") is not None:
+        # Apply the accepted hunks against the verified base
+        accepted = human_response.get("accepted")
+        base = _resolve_edit_base(state, data)
+        try:
+            if base is None:
+                raise StaleBaseError("Base content changed since the diff was computed")
+            new_code = apply_hunks(base, data["hunks"], accepted)
+        except StaleBaseError as e:
+            return {
+                **state,
+                "action_data": {**data, "error": str(e)},
+                "llm_result": f"[Changes not applied: {e}]"
+            }
         return {
             **state,
-            "llm_result": "[Action rejected by user]"
+            "code": new_code,
+            "action_data": {**data, "accepted": accepted, "result_hash": content_hash(new_code)},
+            "llm_result": state.get("llm_result", "") + "\n[Action approved and executed]"
         }
+    
+    return {
+        **state,
+        "llm_result": state.get("llm_result", "") + "\n[Action approved and executed]"
+    }
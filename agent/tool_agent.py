@@ -0,0 +1,205 @@
+"""
+WillOfCode: Tool-Calling Agent
+The model drives the MCP tools itself: every tool the server exposes is offered
+to it, and all the calls it makes in one turn run concurrently on the pooled
+session. Budgets cap the number of model turns and the wall time per request
+(model calls included), and identical calls within a request are answered from
+a per-request cache.
+
+Destructive tools are never executed here. The first one the model asks for
+ends the loop and becomes the pending action for human_approval_node.
+"""
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from agent.state import WillOfCodeState
+from agent.llm import BudgetExhausted, llm_tool_turn, select_tier
+from agent.mcp_client import submit_mcp_tool, tool_specs
+from agent import file_cache
+from agent.diffing import build_edit_payload
+from agent.file_io import file_version
+from agent.memory import history_for_prompt
+
+MAX_STEPS = int(os.getenv("WOC_TOOL_MAX_STEPS", "6"))             # Model turns per request
+TIME_BUDGET = float(os.getenv("WOC_TOOL_TIME_BUDGET", "60"))      # Seconds per request
+MAX_RESULT_CHARS = 20000    # Tool output fed back to the model
+
+# Tools that change the workspace or run code: approval first
+DESTRUCTIVE_TOOLS = {"delete_file", "run_python", "write_file"}
+
+SYSTEM_PROMPT = """You are WillOfCode's file agent. Use the tools to do what the user asks.
+- Call several tools in the same turn when they do not depend on each other.
+- Read a file before changing it. write_file replaces the whole file.
+- delete_file, write_file and run_python are confirmed by the user before they run;
+  request them only as the final step.
+- When you are done, answer in Markdown without calling any tool."""
+
+# Model turns run here so a provider without a request timeout cannot outlast the budget
+_turns = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool-turn")
+
+
+def _model_turn(messages: list, tools: list, tier: str, deadline: float) -> dict:
+    """llm_tool_turn bounded by the request deadline (raises BudgetExhausted when it passes)"""
+    context = contextvars.copy_context()    # Keep usage tracking / traffic capture
+    future = _turns.submit(context.run, llm_tool_turn, messages, tools, tier, deadline)
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        raise BudgetExhausted("time budget exhausted") from None
+
+
+def _run_tools(calls: list, cache: dict, deadline: float, logs: list) -> dict:
+    """Run non-destructive calls concurrently; returns call id -> result text"""
+    results, futures = {}, {}
+    for call in calls:
+        if not isinstance(call["args"], dict) or "_invalid_arguments" in call["args"]:
+            results[call["id"]] = "ERROR: arguments were not a valid JSON object"
+            continue
+        try:
+            key = (call["name"], json.dumps(call["args"], sort_keys=True))
+            path = call["args"].get("path")
+            cached_file = file_cache.get(path) if call["name"] == "read_file" and isinstance(path, str) else None
+            if key in cache:
+                results[call["id"]] = cache[key]
+                logs.append(f"[TOOLS] {call['name']}({_short_args(call['args'])}) from cache")
+            elif cached_file is not None:
+                results[call["id"]] = cache[key] = cached_file
+                logs.append(f"[TOOLS] read_file({_short_args(call['args'])}) from file cache")
+            else:
+                logs.append(f"[TOOLS] {call['name']}({_short_args(call['args'])})")
+                futures[call["id"]] = (key, submit_mcp_tool(call["name"], **call["args"]))
+        except Exception as e:
+            # A bad call is reported back to the model, never to the HTTP request
+            results[call["id"]] = f"ERROR: {e}"
+
+    started = time.perf_counter()
+    done, not_done = wait([future for _, future in futures.values()], timeout=max(0.0, deadline - time.monotonic()))
+    for call in calls:
+        if call["id"] not in futures:
+            continue
+        key, future = futures[call["id"]]
+        if future in not_done:
+            future.cancel()
+            results[call["id"]] = "ERROR: tool call timed out"
+            continue
+        try:
+            result = future.result()
+        except Exception as e:
+            result = f"ERROR: {e}"
+        cache[key] = result
+        results[call["id"]] = result
+    if futures:
+        logs.append(f"[TOOLS] Ran {len(futures)} tool call(s) concurrently in {time.perf_counter() - started:.2f}s")
+    return results
+
+
+def _short_args(args: dict) -> str:
+    return ", ".join(f"{k}={str(v)[:40]!r}" for k, v in args.items())
+
+
+def _approval_for(call: dict) -> tuple:
+    """(pending_action, action_data, message) for a destructive call"""
+    name, args = call["name"], call["args"]
+    if name == "delete_file":
+        path = args.get("path", "")
+        return "delete", {"type": "delete", "path": path}, \
+            f"**Delete Confirmation Required**\n\nAre you sure you want to delete:\n`{path}`\n\nClick Accept to confirm deletion."
+    if name == "run_python":
+        code = args.get("code", "")
+        return "run_python", {"type": "run_python", "code": code}, \
+            f"**Run Python - Confirmation Required**\n\nCode to execute:\n```python\n{code}\n```\n\nClick Accept to execute this code."
+    path, content = args.get("path", ""), args.get("content", "")
+    current = file_version(path) if path and os.path.isfile(path) else None
+    data = {"type": "write_file", "path": path, "content": content,
+            "expected_hash": current["hash"] if current else ""}
+    summary = "new file"
+    if current is not None:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            stats = build_edit_payload(f.read(), content)["stats"]
+        summary = f"{stats['hunks']} hunk(s), +{stats['added']} -{stats['removed']} lines"
+    return "write_file", data, \
+        f"**Write Confirmation Required**\n\n`{path}` ({summary})\n\nClick Accept to write the file."
+
+
+def tool_agent(state: WillOfCodeState) -> WillOfCodeState:
+    """File operations planned by the model with the discovered MCP tools"""
+    query = state["user_query"]
+    logs = state.get("mcp_logs", []) or []
+    deadline = time.monotonic() + TIME_BUDGET
+    tools = tool_specs()
+
+    user_message = query
+    if state.get("file_path"):
+        user_message += f"\n\n(File open in the editor: {state['file_path']})"
+    memory = history_for_prompt(state)
+    messages = [{"role": "system", "content": SYSTEM_PROMPT + (f"\n\nConversation so far:\n{memory}" if memory else "")},
+                {"role": "user", "content": user_message}]
+
+    cache = {}
+    result_text, pending_action, action_data = "", None, None
+    for step in range(MAX_STEPS if tools else 0):
+        if time.monotonic() >= deadline:
+            result_text = "Stopped: the time budget for this request ran out."
+            break
+        try:
+            reply = _model_turn(messages, tools, select_tier(state.get("intent")), deadline)
+        except BudgetExhausted:
+            result_text = "Stopped: the time budget for this request ran out."
+            break
+        except Exception as e:
+            result_text = f"Error: {e}"
+            break
+        calls = reply["tool_calls"]
+        if not calls:
+            result_text = reply["content"] or "Done."
+            break
+
+        destructive = [c for c in calls if c["name"] in DESTRUCTIVE_TOOLS]
+        safe = [c for c in calls if c["name"] not in DESTRUCTIVE_TOOLS]
+        logs.append(f"[TOOLS] Step {step + 1}: {len(calls)} tool call(s)")
+        results = _run_tools(safe, cache, deadline, logs)
+
+        if destructive:
+            # Hand the first destructive call to human approval and stop here
+            pending_action, action_data, result_text = _approval_for(destructive[0])
+            if reply["content"]:
+                result_text = f"{reply['content']}\n\n{result_text}"
+            if len(destructive) > 1:
+                result_text += f"\n\n*{len(destructive) - 1} more change(s) were proposed; ask again after this one.*"
+            logs.append(f"[TOOLS] {destructive[0]['name']} needs approval")
+            break
+
+        messages.append({
+            "role": "assistant",
+            "content": reply["content"],
+            "tool_calls": [{"id": c["id"], "type": "function",
+                            "function": {"name": c["name"], "arguments": json.dumps(c["args"])}} for c in calls],
+        })
+        for call in calls:
+            messages.append({"role": "tool", "tool_call_id": call["id"],
+                             "content": results[call["id"]][:MAX_RESULT_CHARS]})
+    else:
+        if not tools:
+            result_text = "Error: no MCP tools are available (is the MCP server running?)"
+        else:
+            result_text = f"Stopped after {MAX_STEPS} steps without a final answer."
+
+    history = state.get("agent_history", []) or []
+    history.append("tools")
+    outputs = state.get("agent_outputs", {}) or {}
+    outputs["tools"] = result_text
+
+    return {
+        **state,
+        "current_agent": "tools",
+        "agent_history": history,
+        "agent_outputs": outputs,
+        "mcp_logs": logs,
+        "llm_result": result_text,
+        "pending_action": pending_action,
+        "action_data": action_data,
+    }
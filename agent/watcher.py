@@ -0,0 +1,359 @@
+"""
+WillOfCode: Workspace File Watcher
+Watches the directories the UI and agents touch, invalidates the file/listing
+caches as each event arrives, and coalesces bursts of events into batches for
+subscribers (the SSE stream in server.py).
+
+Backends: inotify through ctypes on Linux, scandir mtime snapshots elsewhere.
+Watches are per directory (not recursive) and added on demand.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from agent import file_cache, listing
+
+DEBOUNCE = 0.2          # Seconds of quiet before a batch is flushed
+MAX_DELAY = 1.0         # Flush at least this often during a continuous burst
+POLL_INTERVAL = 1.0     # Polling backend scan period
+MAX_WATCHED_DIRS = 1024
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")    # wd, mask, cookie, len
+
+
+def _merge(previous: Optional[str], kind: str) -> Optional[str]:
+    """Coalesce two events on the same path into one"""
+    if previous is None or previous == kind:
+        return kind
+    if previous == "deleted" and kind == "created":
+        return "modified"       # Atomic replace (write temp + rename over)
+    if previous == "created" and kind == "modified":
+        return "created"
+    if previous == "created" and kind == "deleted":
+        return None             # Short-lived temp file, nobody needs to hear about it
+    return kind
+
+
+class Watcher:
+    """Directory watches, debouncing and subscriber fan-out. Subclasses provide the events."""
+    backend = "none"
+    reliable = False    # True when every change is guaranteed to produce an event
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = OrderedDict()      # abs dir -> backend handle
+        self._subscribers = []
+        self._pending = OrderedDict()   # abs path -> kind
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._running = False
+        self.batches = 0
+        self.events = 0
+
+    # -- watches -------------------------------------------------------------
+    def watch(self, directory: str):
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if directory in self._dirs:
+                self._dirs.move_to_end(directory)
+                return
+        if not os.path.isdir(directory):
+            return
+        handle = self._add(directory)
+        if handle is None:
+            return
+        with self._lock:
+            self._dirs[directory] = handle
+            while len(self._dirs) > MAX_WATCHED_DIRS:
+                evicted, old = self._dirs.popitem(last=False)
+                self._remove(evicted, old)
+                # Nobody reports changes there any more
+                listing.invalidate(evicted)
+
+    def unwatch(self, directory: str):
+        with self._lock:
+            handle = self._dirs.pop(os.path.abspath(directory), None)
+        if handle is not None:
+            self._remove(directory, handle)
+
+    def is_watched(self, directory: str) -> bool:
+        with self._lock:
+            return os.path.abspath(directory) in self._dirs
+
+    def watched_dirs(self) -> List[str]:
+        with self._lock:
+            return list(self._dirs)
+
+    # -- subscribers ---------------------------------------------------------
+    def subscribe(self, callback: Callable[[List[dict]], None]) -> Callable[[], None]:
+        """Call `callback(batch)` for every flushed batch; returns an unsubscribe function"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    # -- event pipeline ------------------------------------------------------
+    def _emit(self, path: str, kind: str, is_dir: bool = False):
+        # Caches are invalidated right away; only the subscriber fan-out is debounced
+        invalidate_path(path, is_dir)
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event = now
+            self._last_event = now
+            key = path + os.sep if is_dir else path
+            merged = _merge(self._pending.get(key), kind)
+            if merged is None:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = merged
+            self.events += 1
+            self._cond.notify()
+
+    def _flush_loop(self):
+        while self._running:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                quiet_for = now - self._last_event
+                if quiet_for < DEBOUNCE and now - self._first_event < MAX_DELAY:
+                    self._cond.wait(DEBOUNCE - quiet_for)
+                    continue
+                pending, self._pending = self._pending, OrderedDict()
+            if not pending:
+                continue
+            batch = []
+            for key, kind in pending.items():
+                is_dir = key.endswith(os.sep)
+                path = key.rstrip(os.sep) or os.sep
+                batch.append({"path": path, "dir": os.path.dirname(path), "kind": kind, "isDirectory": is_dir})
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[dict]):
+        self.batches += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(batch)
+            except Exception as e:
+                print(f"[WATCHER] Subscriber failed: {e}")
+
+    def _overflow(self):
+        """Events were lost: drop every cache entry under the watched dirs"""
+        print("[WATCHER] Event queue overflowed, clearing caches")
+        file_cache.clear()
+        for directory in self.watched_dirs():
+            listing.invalidate(directory)
+            self._emit(directory, "modified", is_dir=True)
+
+    # -- lifecycle -----------------------------------------------------------
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._flush_loop, name="watcher-flush", daemon=True).start()
+        threading.Thread(target=self._run, name=f"watcher-{self.backend}", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "watched_dirs": len(self._dirs), "events": self.events, "batches": self.batches}
+
+    # -- backend hooks -------------------------------------------------------
+    def _add(self, directory: str):
+        raise NotImplementedError
+
+    def _remove(self, directory: str, handle):
+        pass
+
+    def _run(self):
+        raise NotImplementedError
+
+
+# ============================================================================
+# INOTIFY (Linux)
+# ============================================================================
+class InotifyWatcher(Watcher):
+    backend = "inotify"
+    reliable = True
+
+    def __init__(self):
+        super().__init__()
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd_to_dir = {}
+
+    def _add(self, directory: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            print(f"[WATCHER] Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return None
+        self._wd_to_dir[wd] = directory
+        return wd
+
+    def _remove(self, directory: str, wd):
+        self._libc.inotify_rm_watch(self._fd, wd)
+        self._wd_to_dir.pop(wd, None)
+
+    def _run(self):
+        while self._running:
+            ready, _, _ = select.select([self._fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(buf):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+                name = buf[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self._overflow()
+            return
+        directory = self._wd_to_dir.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            # Kernel dropped the watch (directory removed or unmounted)
+            self._wd_to_dir.pop(wd, None)
+            with self._lock:
+                self._dirs.pop(directory, None)
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self._emit(directory, "deleted", is_dir=True)
+            return
+        path = os.path.join(directory, name) if name else directory
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            self._emit(path, "created", is_dir)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._emit(path, "deleted", is_dir)
+        else:
+            self._emit(path, "modified", is_dir)
+
+
+# ============================================================================
+# POLLING (portable fallback)
+# ============================================================================
+def _snapshot(directory: str) -> Optional[dict]:
+    snapshot = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[entry.name] = (entry.is_dir(follow_symlinks=False), st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+    return snapshot
+
+
+class PollingWatcher(Watcher):
+    backend = "polling"
+
+    def _add(self, directory: str):
+        return {"snapshot": _snapshot(directory) or {}}
+
+    def _run(self):
+        while self._running:
+            time.sleep(POLL_INTERVAL)
+            for directory in self.watched_dirs():
+                with self._lock:
+                    handle = self._dirs.get(directory)
+                if handle is None:
+                    continue
+                current = _snapshot(directory)
+                if current is None:
+                    self._emit(directory, "deleted", is_dir=True)
+                    self.unwatch(directory)
+                    continue
+                previous = handle["snapshot"]
+                for name, info in current.items():
+                    old = previous.get(name)
+                    if old is None:
+                        self._emit(os.path.join(directory, name), "created", info[0])
+                    elif old != info:
+                        self._emit(os.path.join(directory, name), "modified", info[0])
+                for name, info in previous.items():
+                    if name not in current:
+                        self._emit(os.path.join(directory, name), "deleted", info[0])
+                handle["snapshot"] = current
+
+
+# ============================================================================
+# CACHE INVALIDATION & SINGLETON
+# ============================================================================
+def invalidate_path(path: str, is_dir: bool = False):
+    file_cache.invalidate(path)
+    listing.invalidate(os.path.dirname(path))
+    if is_dir:
+        listing.invalidate(path)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher() -> Optional[Watcher]:
+    return _watcher
+
+
+def start_watcher(force_polling: bool = False) -> Watcher:
+    """Start the process-wide watcher (inotify if available) and hook it into the caches"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            watcher = None
+            if sys.platform.startswith("linux") and not force_polling:
+                try:
+                    watcher = InotifyWatcher()
+                except (OSError, AttributeError) as e:
+                    print(f"[WATCHER] inotify unavailable, polling instead: {e}")
+            watcher = watcher or PollingWatcher()
+            watcher.start()
+            file_cache.attach_watcher(watcher)
+            listing.attach_watcher(watcher)
+            _watcher = watcher
+        return _watcher
@@ -0,0 +1,178 @@
+"""
+WillOfCode: Headless Batch Runs
+
+Runs the reviewer or debug agent over a directory (or a list of files) with a
+bounded number of files in flight, streaming one JSON line per file to a report.
+Re-running with the same report skips files whose content was already processed,
+so an interrupted run picks up where it stopped.
+
+Examples:
+    python batch.py src/ --agent reviewer --report review.jsonl
+    git diff --name-only HEAD~1 | python batch.py --files-from - --agent debug -j 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from agent.agents import reviewer_agent, debug_agent
+from agent.llm import track_usage
+
+DEFAULT_EXTENSIONS = [".py", ".js", ".ts", ".tsx", ".jsx", ".java", ".go", ".rs", ".c", ".cpp", ".h", ".cs", ".rb", ".php"]
+SKIP_DIRS = {".git", ".venv", "venv", "node_modules", "__pycache__", "dist", "build"}
+MAX_FILE_BYTES = 200 * 1024
+DEFAULT_CONCURRENCY = 8
+
+# agent name -> (agent function, intent, default query)
+BATCH_AGENTS = {
+    "reviewer": (reviewer_agent, "code_review", "Review this code for bugs, readability and best practices"),
+    "debug": (debug_agent, "debug", "Find bugs and potential runtime errors in this code"),
+}
+
+
+def collect_files(paths, extensions) -> list:
+    """Expand directories (recursively) into files with one of the given extensions"""
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(os.path.abspath(path))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in extensions:
+                    files.append(os.path.abspath(os.path.join(root, name)))
+    return list(dict.fromkeys(files))
+
+
+def job_key(content_hash: str, agent: str, query: str) -> str:
+    return f"{agent}:{hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]}:{content_hash}"
+
+
+def load_done(report_path: str) -> set:
+    """Keys of the jobs that already finished successfully in an earlier run"""
+    done = set()
+    if not os.path.exists(report_path):
+        return done
+    with open(report_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # Torn last line of an interrupted run
+            if record.get("status") == "ok" and record.get("key"):
+                done.add(record["key"])
+    return done
+
+
+def run_file(path: str, agent: str, query: str, done: set = frozenset()):
+    """
+    Run one agent over one file. Returns the report record (failures included, it never
+    raises), or None when this exact content was already processed according to `done`.
+    """
+    record = {"path": path, "agent": agent}
+    try:
+        if os.path.getsize(path) > MAX_FILE_BYTES:
+            return {**record, "status": "skipped", "error": "file too large"}
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except UnicodeDecodeError:
+        return {**record, "status": "skipped", "error": "not a text file"}
+    except OSError as e:
+        return {**record, "status": "error", "error": str(e)}
+
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    record.update({"hash": content_hash, "key": job_key(content_hash, agent, query)})
+    if record["key"] in done:
+        return None
+    agent_fn, intent, _ = BATCH_AGENTS[agent]
+    state = {
+        "user_query": query,
+        "intent": intent,
+        "file_path": path,
+        "file_content": content,
+        "agent_history": [],
+        "agent_outputs": {},
+    }
+    start = time.perf_counter()
+    with track_usage() as usage:
+        try:
+            result = agent_fn(state)
+        except Exception as e:
+            return {**record, "status": "error", "error": str(e),
+                    "latency": round(time.perf_counter() - start, 3), "usage": usage}
+    text = result.get("llm_result") or ""
+    status = "error" if text.startswith(("Error", "Could not")) else "ok"
+    return {**record, "status": status, "latency": round(time.perf_counter() - start, 3),
+            "usage": usage, "result": text}
+
+
+def run_batch(files, agent: str, query: str, report_path: str, concurrency: int = DEFAULT_CONCURRENCY,
+              progress=None) -> dict:
+    """Process files concurrently, appending one JSON line per file to the report"""
+    done = load_done(report_path)
+    summary = {"total": len(files), "ok": 0, "error": 0, "skipped": 0, "resumed": 0,
+               "input_tokens": 0, "output_tokens": 0}
+    started = time.perf_counter()
+
+    with open(report_path, "a", encoding="utf-8") as report, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_file, path, agent, query, done): path for path in files}
+        for future in as_completed(futures):
+            record = future.result()
+            if record is None:
+                summary["resumed"] += 1
+                continue
+            summary[record["status"]] += 1
+            usage = record.get("usage") or {}
+            summary["input_tokens"] += usage.get("input_tokens", 0)
+            summary["output_tokens"] += usage.get("output_tokens", 0)
+            # Written as each file finishes, so an interrupted run loses nothing
+            report.write(json.dumps(record, ensure_ascii=False) + "\n")
+            report.flush()
+            if progress:
+                progress(record)
+
+    summary["wall_time"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the reviewer or debug agent over many files")
+    parser.add_argument("paths", nargs="*", help="Files or directories (directories are walked recursively)")
+    parser.add_argument("--files-from", help="Read file paths from this file, one per line ('-' for stdin)")
+    parser.add_argument("--agent", choices=sorted(BATCH_AGENTS), default="reviewer")
+    parser.add_argument("--query", help="Instruction sent with every file (defaults to one per agent)")
+    parser.add_argument("--report", default="batch_report.jsonl", help="JSONL report, appended to and used to resume")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--ext", action="append", help="File extensions to include when walking directories")
+    args = parser.parse_args(argv)
+
+    paths = list(args.paths)
+    if args.files_from:
+        source = sys.stdin if args.files_from == "-" else open(args.files_from, "r", encoding="utf-8")
+        with source:
+            paths.extend(line.strip() for line in source if line.strip())
+    if not paths:
+        parser.error("give at least one path or --files-from")
+
+    extensions = {e.lower() if e.startswith(".") else f".{e.lower()}" for e in (args.ext or DEFAULT_EXTENSIONS)}
+    files = collect_files(paths, extensions)
+    query = args.query or BATCH_AGENTS[args.agent][2]
+
+    def progress(record):
+        usage = record.get("usage") or {}
+        print(f"[{record['status']:>7}] {record['path']} "
+              f"{record.get('latency', 0):.1f}s {usage.get('input_tokens', 0)}+{usage.get('output_tokens', 0)} tok",
+              file=sys.stderr)
+
+    print(f"[BATCH] {len(files)} files, agent={args.agent}, concurrency={args.concurrency}", file=sys.stderr)
+    summary = run_batch(files, args.agent, query, args.report, max(1, args.concurrency), progress)
+    print(json.dumps(summary))
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
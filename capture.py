@@ -0,0 +1,169 @@
+"""
+Traffic Capture
+
+Opt-in recording of /api/chat and /api/confirm traffic for load replay
+(see replay.py). Set WOC_CAPTURE=traffic.jsonl and every request to a wrapped
+route appends one JSON line with:
+
+- request shape: endpoint, intent, message and file_content sizes, tool mode,
+  approve/reject and how many hunks were accepted
+- timing: wall-clock timestamp, think time since the thread's previous request,
+  server latency and status
+- the LLM calls the request made: kind, schema, latency, prompt/output sizes
+
+Captures are anonymized: thread ids are keyed hashes (the key is random per
+process), and no message text, file content or path is written. Model output
+text is only kept with WOC_CAPTURE_CONTENT=1, for replays that must return the
+exact recorded responses.
+"""
+import functools
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+
+from agent.llm import capture_calls
+from agent.supervisor import detect_intent
+
+CAPTURE_PATH = os.getenv("WOC_CAPTURE")
+CAPTURE_CONTENT = os.getenv("WOC_CAPTURE_CONTENT", "0") == "1"
+MAX_THREADS = 10000         # Threads remembered for think time
+
+_salt = os.urandom(16)
+_last_seen = OrderedDict()  # anonymized thread -> monotonic time its last request finished
+_lock = threading.Lock()
+_log = None
+
+
+def _anonymize(thread_id: str) -> str:
+    return hmac.new(_salt, thread_id.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+
+def _think_time(thread: str, started: float, finished: float):
+    """Seconds between the end of the thread's previous request and the start of this one"""
+    with _lock:
+        previous = _last_seen.pop(thread, None)
+        _last_seen[thread] = finished
+        while len(_last_seen) > MAX_THREADS:
+            _last_seen.popitem(last=False)
+    return None if previous is None else round(max(0.0, started - previous), 3)
+
+
+def _llm_calls(calls: list) -> list:
+    records = []
+    for call in calls:
+        record = {
+            "kind": call["kind"],
+            "latency": call["latency"],
+            "in": call["prompt_chars"],
+            "out": len(call["output"] or ""),
+        }
+        if call["schema"]:
+            record["schema"] = call["schema"]
+        if call["tool_calls"]:
+            record["tools"] = call["tool_calls"]
+        if CAPTURE_CONTENT:
+            record["text"] = call["output"]
+        records.append(record)
+    return records
+
+
+def _chat_fields(data: dict, body: dict) -> dict:
+    message = data.get("message") or ""
+    action_data = body.get("action_data") or {}
+    fields = {
+        "intent": body.get("intent") or detect_intent(message),
+        "agent": body.get("current_agent"),
+        "msg_chars": len(message),
+        "file_chars": len(data.get("file_content") or ""),
+        "has_path": bool(data.get("file_path")),
+        "tools": bool(data.get("tools")),
+        "pending": body.get("pending_action"),
+    }
+    if action_data.get("hunks") is not None:
+        fields["hunks"] = len(action_data["hunks"])
+    return fields
+
+
+def _confirm_fields(data: dict) -> dict:
+    action_data = data.get("action_data") or {}
+    accepted = action_data.get("accepted")
+    return {
+        "action": data.get("action"),
+        "type": action_data.get("type"),
+        "accepted": None if accepted is None else len(accepted),  # None: all hunks
+    }
+
+
+class CaptureLog:
+    """Append-only JSONL file shared by all request threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.records += 1
+            self._file.write(line)
+            self._file.flush()
+
+
+def _get_log() -> CaptureLog:
+    global _log
+    if _log is None:
+        with _lock:
+            if _log is None:
+                _log = CaptureLog(CAPTURE_PATH)
+                print(f"[CAPTURE] Recording /api/chat and /api/confirm traffic to {CAPTURE_PATH}")
+    return _log
+
+
+def captured(endpoint: str):
+    """Record requests to the decorated view (no-op unless WOC_CAPTURE is set)"""
+    def decorator(view):
+        if not CAPTURE_PATH:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            timestamp = time.time()
+            started = time.monotonic()
+            with capture_calls() as calls:
+                response = current_app.make_response(view(*args, **kwargs))
+            finished = time.monotonic()
+
+            data = request.get_json(silent=True) or {}
+            thread = _anonymize(str(data.get("thread_id") or "default"))
+            record = {
+                "ts": round(timestamp, 3),
+                "ep": endpoint,
+                "thread": thread,
+                "think": _think_time(thread, started, finished),
+                "status": response.status_code,
+                "latency": round(finished - started, 4),
+            }
+            try:
+                if endpoint == "chat":
+                    record.update(_chat_fields(data, response.get_json(silent=True) or {}))
+                else:
+                    record.update(_confirm_fields(data))
+                record["llm"] = _llm_calls(calls)
+                _get_log().write(record)
+            except Exception as e:
+                # Capture must never break the request it is recording
+                print(f"[CAPTURE] Could not record {request.path}: {e}")
+            return response
+        return wrapper
+    return decorator
+
+
+def capture_stats():
+    return {"path": CAPTURE_PATH, "records": _log.records if _log else 0} if CAPTURE_PATH else None
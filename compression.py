@@ -0,0 +1,195 @@
+"""
+HTTP Compression & Caching
+
+- Negotiates br/gzip for JSON responses above a size threshold
+- Precompresses static assets and serves them with strong ETags + 304s
+- index.html references versioned asset URLs so they can be cached for a year
+
+Brotli is used when the `brotli` package is installed, gzip otherwise.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_SIZE = int(os.getenv("WOC_MIN_COMPRESS_SIZE", "1024"))   # Bytes
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5          # Dynamic responses: fast; static assets use 11
+STATIC_MAX_AGE = 31536000   # One year, only for versioned (?v=...) URLs
+
+STATIC_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+}
+
+# index.html asset references rewritten to versioned URLs
+VERSIONED_REFS = {
+    'href="styles.css"': "styles.css",
+    'src="script.js"': "script.js",
+}
+
+
+def available_encodings() -> list:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: str):
+    """Best encoding the client accepts (q > 0), or None for identity"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+    return data
+
+
+# ============================================================================
+# STATIC ASSETS
+# ============================================================================
+class StaticAsset:
+    """One static file, held in memory in every supported encoding"""
+
+    def __init__(self, path: str, body: bytes, mtime_ns: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.mimetype = STATIC_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {None: body}
+        for encoding in available_encodings():
+            compressed = compress(body, encoding, static=True)
+            if len(compressed) < len(body):
+                self.bodies[encoding] = compressed
+
+
+class StaticAssets:
+    """Precompressed static files, rebuilt if a file changes on disk"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name: str) -> StaticAsset:
+        path = os.path.join(self.folder, name)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            body = f.read()
+        if name == "index.html":
+            text = body.decode("utf-8")
+            for ref, asset_name in VERSIONED_REFS.items():
+                version = self.get(asset_name).etag[:12]
+                text = text.replace(ref, ref[:-1] + f'?v={version}"')
+            body = text.encode("utf-8")
+        return StaticAsset(path, body, mtime_ns)
+
+    def get(self, name: str) -> StaticAsset:
+        path = os.path.join(self.folder, name)
+        with self._lock:
+            asset = self._assets.get(name)
+        if asset is None or os.stat(path).st_mtime_ns != asset.mtime_ns or name == "index.html" and self._stale_index(asset):
+            asset = self._load(name)
+            with self._lock:
+                self._assets[name] = asset
+        return asset
+
+    def _stale_index(self, asset: StaticAsset) -> bool:
+        # index.html embeds asset versions, so rebuild it when any of them changes
+        body = asset.bodies[None]
+        return any(f"?v={self.get(name).etag[:12]}".encode() not in body for name in VERSIONED_REFS.values())
+
+    def preload(self):
+        """Compress every servable asset up front so the first request is cheap"""
+        for name in sorted(os.listdir(self.folder)):
+            if os.path.splitext(name)[1] in STATIC_TYPES:
+                self.get(name)
+
+    def response(self, name: str) -> Response:
+        asset = self.get(name)
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding not in asset.bodies:
+            encoding = None
+        etag = representation_etag(asset.etag, encoding)
+        if request.args.get("v"):
+            cache_control = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            cache_control = "no-cache"
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if etag_matches(etag):
+            return Response(status=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(asset.bodies[encoding], mimetype=asset.mimetype, headers=headers)
+
+
+# ============================================================================
+# DYNAMIC RESPONSES
+# ============================================================================
+def representation_etag(digest: str, encoding) -> str:
+    """Strong ETags must differ per content-coding"""
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def etag_matches(etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match", "")
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook: conditional GETs and br/gzip for large JSON bodies"""
+    if (response.mimetype != "application/json" or response.direct_passthrough
+            or response.status_code != 200 or "Content-Encoding" in response.headers):
+        return response
+
+    body = response.get_data()
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    response.vary.add("Accept-Encoding")
+
+    if request.method == "GET":
+        # Repeated reads of an unchanged file cost a 304 instead of the whole body
+        etag = representation_etag(hashlib.sha256(body).hexdigest()[:32], encoding)
+        response.headers["ETag"] = etag
+        response.headers.setdefault("Cache-Control", "no-cache")
+        if etag_matches(etag):
+            response.status_code = 304
+            response.set_data(b"")
+            return response
+
+    if encoding is not None:
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app, static_folder: str) -> StaticAssets:
+    assets = StaticAssets(static_folder)
+    assets.preload()
+    app.after_request(compress_response)
+    return assets
@@ -9,6 +9,7 @@ Tools:
 - run_python: Execute Python code
 """
 from mcp.server.fastmcp import FastMCP
+from agent.file_io import atomic_write_text
 import os
 
 mcp = FastMCP("file-ops")
@@ -25,11 +26,11 @@ def read_file(path: str) -> str:
 
 
 @mcp.tool()
-def write_file(path: str, content: str) -> str:
-    """Write content to a file (creates or overwrites)"""
+def write_file(path: str, content: str, expected_hash: str = "") -> str:
+    """Write content to a file (creates or overwrites) atomically.
+    Pass expected_hash (sha256 of the version you read) to refuse overwriting newer content."""
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(content)
+        atomic_write_text(path, content, expected_hash=expected_hash or None)
         return f"File saved: {path}"
     except Exception as e:
         return f"ERROR: {e}"
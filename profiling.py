@@ -0,0 +1,211 @@
+"""
+Request Profiling
+
+Runs cProfile and tracemalloc around a single request and keeps the top CPU
+hotspots and allocation sites, keyed by request ID, for /api/debug/profiles.
+
+- On demand: `X-Profile: 1` header or `?profile=1`, admin only
+- Sampled: WOC_PROFILE_SAMPLE_RATE (0..1) of agent requests are profiled automatically
+
+Admin means the `X-Admin-Token` header matches WOC_ADMIN_TOKEN. Without a
+token, WOC_ADMIN_LOCAL=1 admits direct connections from localhost (never
+requests that came through a proxy). Only one request is profiled at
+a time (the profiler is process-wide), so numbers can include work done by
+other threads during that request.
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from flask import g, jsonify, request
+
+SAMPLE_RATE = float(os.getenv("WOC_PROFILE_SAMPLE_RATE", "0"))
+SAMPLED_PATHS = {"/api/chat", "/api/confirm"}
+TOP_N = int(os.getenv("WOC_PROFILE_TOP_N", "25"))
+MAX_PROFILES = 50
+TRACE_FRAMES = 1
+
+_profiles = OrderedDict()     # request id -> report
+_profiles_lock = threading.Lock()
+_active = threading.Lock()    # Held while a request is being profiled
+
+
+PROXY_HEADERS = ("Forwarded", "X-Forwarded-For", "X-Real-IP")
+
+
+def is_admin() -> bool:
+    token = os.getenv("WOC_ADMIN_TOKEN")
+    if token:
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token)
+    if os.getenv("WOC_ADMIN_LOCAL", "0") != "1":
+        return False
+    # Behind a local reverse proxy every client connects from loopback
+    if any(header in request.headers for header in PROXY_HEADERS):
+        return False
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
+def _requested() -> bool:
+    flag = request.headers.get("X-Profile") or request.args.get("profile")
+    return flag in ("1", "true", "yes") and is_admin()
+
+
+def _sampled() -> bool:
+    return SAMPLE_RATE > 0 and request.path in SAMPLED_PATHS and random.random() < SAMPLE_RATE
+
+
+# ============================================================================
+# REPORTS
+# ============================================================================
+def _cpu_hotspots(profile: cProfile.Profile) -> dict:
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": function,
+            "file": filename,
+            "line": line,
+            "calls": ncalls,
+            "self_s": round(tottime, 6),
+            "cumulative_s": round(cumtime, 6),
+        })
+    by_cumulative = sorted(rows, key=lambda row: row["cumulative_s"], reverse=True)[:TOP_N]
+    by_self = sorted(rows, key=lambda row: row["self_s"], reverse=True)[:TOP_N]
+    return {"by_cumulative": by_cumulative, "by_self": by_self}
+
+
+def _allocation_sites(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> list:
+    sites = []
+    for diff in after.compare_to(before, "lineno")[:TOP_N]:
+        frame = diff.traceback[0]
+        sites.append({
+            "file": frame.filename,
+            "line": frame.lineno,
+            "size_kb": round(diff.size_diff / 1024, 1),
+            "count": diff.count_diff,
+        })
+    return sites
+
+
+def _store(report: dict):
+    with _profiles_lock:
+        _profiles[report["id"]] = report
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+
+
+# ============================================================================
+# REQUEST HOOKS
+# ============================================================================
+def _start_profile():
+    reason = "requested" if _requested() else "sampled" if _sampled() else None
+    if reason is None:
+        return
+    if not _active.acquire(blocking=False):
+        g.profile_busy = True
+        return
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACE_FRAMES)
+    profiler = cProfile.Profile()
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        profiler.enable()
+    except ValueError as e:
+        # Someone else (a debugger, an outer profiler) owns the profiling hook
+        print(f"[PROFILE] Cannot profile {request.path}: {e}")
+        if started_tracing:
+            tracemalloc.stop()
+        _active.release()
+        g.profile_busy = True
+        return
+    g.profile = {
+        "id": uuid.uuid4().hex[:12],
+        "reason": reason,
+        "started_tracing": started_tracing,
+        "snapshot": snapshot,
+        "start": time.perf_counter(),
+        "profiler": profiler,
+    }
+
+
+def _finish_profile(status: int = None):
+    state = g.pop("profile", None)
+    if state is None:
+        return None
+    try:
+        state["profiler"].disable()
+        duration = time.perf_counter() - state["start"]
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        report = {
+            "id": state["id"],
+            "reason": state["reason"],
+            "method": request.method,
+            "path": request.path,
+            "status": status,
+            "timestamp": time.time(),
+            "duration_s": round(duration, 4),
+            "peak_traced_kb": round(peak / 1024, 1),
+            "cpu": _cpu_hotspots(state["profiler"]),
+            "allocations": _allocation_sites(state["snapshot"], after),
+        }
+        _store(report)
+        return report["id"]
+    finally:
+        if state["started_tracing"]:
+            tracemalloc.stop()
+        _active.release()
+
+
+def _after_request(response):
+    # Registered before the compression hook, so it runs after it and includes encoding
+    profile_id = _finish_profile(response.status_code)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    elif g.pop("profile_busy", False):
+        response.headers["X-Profile-Id"] = "busy"
+    return response
+
+
+def _teardown_request(error=None):
+    # after_request is skipped on unhandled errors; never leave the profiler running
+    _finish_profile(500)
+
+
+# ============================================================================
+# DEBUG ENDPOINTS
+# ============================================================================
+def list_profiles():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    with _profiles_lock:
+        reports = list(_profiles.values())
+    summaries = [{k: r[k] for k in ("id", "reason", "method", "path", "status", "timestamp", "duration_s", "peak_traced_kb")}
+                 for r in reversed(reports)]
+    return jsonify({'profiles': summaries, 'sample_rate': SAMPLE_RATE})
+
+
+def get_profile(profile_id):
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    with _profiles_lock:
+        report = _profiles.get(profile_id)
+    if report is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(report)
+
+
+def init_profiling(app):
+    """Install the hooks; call before init_compression so encoding time is profiled too"""
+    app.before_request(_start_profile)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/api/debug/profiles', 'list_profiles', list_profiles, methods=['GET'])
+    app.add_url_rule('/api/debug/profiles/<profile_id>', 'get_profile', get_profile, methods=['GET'])
@@ -0,0 +1,442 @@
+"""
+WillOfCode: Traffic Replay
+
+Replays a capture recorded with WOC_CAPTURE (see capture.py) against a local
+server at N× the recorded pace and reports throughput, p50/p95/p99 latency and
+server memory over time.
+
+Requests are rebuilt from the captured shape: same intent mix, message and file
+sizes, tool mode and approve/reject decisions, with each thread's think time
+divided by --speed. Every message carries a `[replay:<n>]` marker, and a stub
+model (an OpenAI-compatible endpoint started here) answers each LLM call with
+the n-th record's recorded response: the captured text when the capture kept
+it (WOC_CAPTURE_CONTENT=1), otherwise synthetic output of the recorded size and
+shape. --inject-latency makes the stub wait as long as the recorded call took.
+
+Nothing destructive is replayed: tool-mode calls are answered without tool
+calls, and accepted deletes, writes and code runs are sent as rejects.
+
+Examples:
+    python replay.py traffic.jsonl --speed 10
+    python replay.py traffic.jsonl --speed 2 --inject-latency --report replay.json
+    python replay.py traffic.jsonl --url http://127.0.0.1:5000 --pid 4242   # already running server
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agent.supervisor import INTENT_KEYWORDS
+
+DEFAULT_PORT = 5055
+DEFAULT_STUB_PORT = 8765
+DEFAULT_MAX_THREADS = 64
+SAMPLE_INTERVAL = 1.0       # Seconds between memory samples
+REQUEST_TIMEOUT = 300
+DESTRUCTIVE_TYPES = {"delete", "run_python", "write_file"}
+
+MARKER = re.compile(r"\[replay:(\d+)\]")
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+
+
+def load_capture(path: str) -> list:
+    """Captured chat/confirm records in arrival order (torn or foreign lines are skipped)"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("ep") in ("chat", "confirm") and "ts" in record:
+                records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def _filler(chars: int) -> str:
+    return (FILLER * (chars // len(FILLER) + 1))[:max(chars, 0)]
+
+
+# ============================================================================
+# SYNTHETIC CONTENT
+# ============================================================================
+def synthetic_file(seed: int, chars: int) -> str:
+    """Deterministic code-like file of about `chars` characters"""
+    lines, size, i = [], 0, 0
+    while size < chars:
+        line = f"value_{seed}_{i} = {i}  # synthetic line\n"
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return "".join(lines)
+
+
+def synthetic_edit(seed: int, chars: int, hunks: int) -> str:
+    """synthetic_file() with `hunks` evenly spaced single-line changes"""
+    lines = synthetic_file(seed, chars).splitlines(keepends=True)
+    hunks = min(max(hunks, 1), len(lines)) if lines else 0
+    step = max(len(lines) // max(hunks, 1), 2)
+    for n in range(hunks):
+        i = min(n * step, len(lines) - 1)
+        lines[i] = f"value_{seed}_{i} = {i} + 1  # replayed edit\n"
+    return "".join(lines)
+
+
+def chat_message(index: int, record: dict) -> str:
+    """A message routed to the recorded intent, padded to the recorded length"""
+    keywords = INTENT_KEYWORDS.get(record.get("intent"))
+    text = f"[replay:{index}] {keywords[0] if keywords else 'write a function'} "
+    return text + _filler(record.get("msg_chars", 0) - len(text))
+
+
+# ============================================================================
+# STUB MODEL
+# ============================================================================
+class StubModel:
+    """Serves the recorded LLM responses of each replayed request, in order"""
+
+    def __init__(self, records: list, inject_latency: bool = False, latency_scale: float = 1.0):
+        self.records = records
+        self.inject_latency = inject_latency
+        self.latency_scale = latency_scale
+        self._served = {}   # record index -> calls answered so far
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.unmatched = 0
+
+    def _next_call(self, text: str):
+        # The newest marker is the current request; older ones come from conversation memory
+        indexes = [int(m) for m in MARKER.findall(text) if int(m) < len(self.records)]
+        if not indexes:
+            return None, None
+        index = max(indexes)
+        with self._lock:
+            n = self._served.get(index, 0)
+            self._served[index] = n + 1
+        calls = self.records[index].get("llm") or []
+        return index, calls[n] if n < len(calls) else None
+
+    def _json_reply(self, index: int, properties: dict) -> str:
+        record = self.records[index] if index is not None else {}
+        reply = {}
+        for name, spec in properties.items():
+            if name.endswith("_code"):
+                value = synthetic_edit(index or 0, record.get("file_chars", 0), record.get("hunks") or 1)
+            else:
+                value = "Replayed change"
+            reply[name] = [value] if spec.get("type") == "array" else value
+        return json.dumps(reply)
+
+    def reply(self, body: dict) -> str:
+        text = "\n".join(str(m.get("content") or "") for m in body.get("messages", []))
+        index, call = self._next_call(text)
+        with self._lock:
+            self.calls += 1
+            self.unmatched += call is None
+        if call and self.inject_latency:
+            time.sleep(call["latency"] * self.latency_scale)
+
+        response_format = (body.get("response_format") or {}).get("json_schema")
+        if call and "text" in call:
+            return call["text"]
+        if response_format:
+            return self._json_reply(index, response_format["schema"].get("properties", {}))
+        if call and call.get("schema"):
+            # Structured output unsupported upstream: the prompt asked for plain JSON
+            fields = {"edit_response": ["modified_code", "changes"], "refactor_response": ["refactored_code", "changes"]}
+            names = next((v for k, v in fields.items() if call["schema"].startswith(k)), ["response"])
+            return self._json_reply(index, {name: {"type": "string"} for name in names})
+        return _filler(call["out"]) if call else "OK."
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                content = stub.reply(body)
+                prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages", []))
+                out = json.dumps({
+                    "id": "replay", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                              "total_tokens": (prompt_chars + len(content)) // 4},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="replay-stub", daemon=True).start()
+        return server
+
+
+# ============================================================================
+# SERVER PROCESS
+# ============================================================================
+def spawn_server(port: int, stub_url: str, log_path: str) -> subprocess.Popen:
+    """Start server.py on `port` with every model tier pointed at the stub"""
+    env = {**os.environ,
+           "WOC_FAST_MODELS": "local:replay", "WOC_STRONG_MODELS": "local:replay",
+           "WOC_LOCAL_BASE_URL": stub_url, "WOC_WATCH": "0"}
+    env.pop("WOC_CAPTURE", None)
+    log = open(log_path, "a", encoding="utf-8")
+    return subprocess.Popen(
+        [sys.executable, "-c", f"from server import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, timeout: float = 60.0, process: subprocess.Popen = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/api/models", timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    raise RuntimeError(f"server at {url} did not come up within {timeout:.0f}s")
+
+
+def rss_mb(pid: int):
+    """Resident memory of a process in MB (Linux /proc; None elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    def __init__(self, pid: int, interval: float = SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []   # [seconds since start, RSS MB]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replay-memory", daemon=True)
+
+    def _run(self):
+        started = time.monotonic()
+        while True:
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.samples.append([round(time.monotonic() - started, 1), value])
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        value = rss_mb(self.pid)
+        if value is not None and self.samples:
+            self.samples.append([self.samples[-1][0], value])
+
+    def summary(self) -> dict:
+        values = [v for _, v in self.samples]
+        if not values:
+            return {"samples": []}
+        return {"start_mb": values[0], "peak_mb": max(values), "end_mb": values[-1], "samples": self.samples}
+
+
+# ============================================================================
+# LOAD GENERATION
+# ============================================================================
+def percentile(values: list, p: float):
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class Replay:
+    def __init__(self, url: str, records: list, speed: float, run_id: str):
+        self.url = url.rstrip("/")
+        self.records = records
+        self.speed = speed
+        self.run_id = run_id
+        self.results = []       # (endpoint, latency, status)
+        self.skipped = 0
+        self.destructive_rejected = 0
+        self._lock = threading.Lock()
+
+    def _post(self, endpoint: str, body: dict) -> dict:
+        request = urllib.request.Request(f"{self.url}/api/{endpoint}", data=json.dumps(body).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        started = time.perf_counter()
+        status, reply = None, {}
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                status = response.status
+                reply = json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError, json.JSONDecodeError):
+            pass
+        with self._lock:
+            self.results.append((endpoint, time.perf_counter() - started, status))
+        return reply
+
+    def _confirm_body(self, record: dict, pending, thread_id: str):
+        body = {"thread_id": thread_id, "action": "reject", "action_data": {}}
+        if record.get("action") != "accept":
+            return body
+        if pending is None:
+            return None     # The replayed chat proposed nothing to accept
+        if pending.get("type") in DESTRUCTIVE_TYPES:
+            with self._lock:
+                self.destructive_rejected += 1
+            return body
+        hunks = pending.get("hunks")
+        accepted = None
+        if hunks is not None and record.get("accepted") is not None:
+            accepted = list(range(min(record["accepted"], len(hunks))))
+        return {**body, "action": "accept",
+                "action_data": {"type": pending.get("type"), "path": pending.get("path"),
+                                "base_hash": pending.get("base_hash"), "accepted": accepted}}
+
+    def _play_thread(self, thread: str, indexes: list, start: float, base: float):
+        thread_id = f"replay-{self.run_id}-{thread}"
+        pending = None
+        for index in indexes:
+            record = self.records[index]
+            delay = start + (record["ts"] - base) / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if record["ep"] == "chat":
+                body = {"thread_id": thread_id, "message": chat_message(index, record), "tools": record.get("tools", False)}
+                if record.get("file_chars"):
+                    body["file_content"] = synthetic_file(index, record["file_chars"])
+                if record.get("has_path"):
+                    body["file_path"] = f"replay_{index}.py"
+                reply = self._post("chat", body)
+                pending = reply.get("action_data") if reply.get("pending_action") else None
+            else:
+                body = self._confirm_body(record, pending, thread_id)
+                pending = None
+                if body is None:
+                    with self._lock:
+                        self.skipped += 1
+                    continue
+                self._post("confirm", body)
+
+    def run(self, max_threads: int = DEFAULT_MAX_THREADS) -> float:
+        """Replay every captured thread concurrently; returns the wall time"""
+        threads = {}
+        for index, record in enumerate(self.records):
+            threads.setdefault(record.get("thread", "default"), []).append(index)
+        base = self.records[0]["ts"]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_threads, len(threads)))) as pool:
+            futures = [pool.submit(self._play_thread, thread, indexes, start, base) for thread, indexes in threads.items()]
+            for future in futures:
+                future.result()
+        return time.monotonic() - start
+
+    def summary(self, wall_time: float) -> dict:
+        def latency(endpoint=None):
+            values = sorted(l for e, l, _ in self.results if endpoint is None or e == endpoint)
+            return {"count": len(values),
+                    **{f"p{p}": round(percentile(values, p), 4) if values else None for p in (50, 95, 99)},
+                    "max": round(values[-1], 4) if values else None}
+
+        errors = sum(1 for _, _, status in self.results if status is None or status >= 400)
+        captured_span = self.records[-1]["ts"] - self.records[0]["ts"]
+        return {
+            "requests": len(self.results),
+            "errors": errors,
+            "skipped": self.skipped,
+            "destructive_rejected": self.destructive_rejected,
+            "wall_time": round(wall_time, 2),
+            "throughput_rps": round(len(self.results) / wall_time, 2) if wall_time else None,
+            "captured_span": round(captured_span, 2),
+            "speed": self.speed,
+            "latency": {"all": latency(), "chat": latency("chat"), "confirm": latency("confirm")},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured chat/confirm traffic against a local server")
+    parser.add_argument("capture", help="JSONL capture written with WOC_CAPTURE")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded")
+    parser.add_argument("--url", help="Use an already running server (its models must point at the stub)")
+    parser.add_argument("--pid", type=int, help="Server process to sample memory from (with --url)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port for the spawned server")
+    parser.add_argument("--stub-port", type=int, default=DEFAULT_STUB_PORT, help="Port for the stub model")
+    parser.add_argument("--inject-latency", action="store_true", help="Stub waits as long as each recorded LLM call took")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for injected latencies")
+    parser.add_argument("--max-threads", type=int, default=DEFAULT_MAX_THREADS, help="Conversation threads replayed at once")
+    parser.add_argument("--server-log", default=os.devnull, help="Output of the spawned server")
+    parser.add_argument("--report", help="Also write the JSON summary to this file")
+    args = parser.parse_args(argv)
+
+    records = load_capture(args.capture)
+    if not records:
+        parser.error(f"no chat/confirm records in {args.capture}")
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    stub = StubModel(records, args.inject_latency, args.latency_scale)
+    stub_server = stub.serve(args.stub_port)
+    stub_url = f"http://127.0.0.1:{stub_server.server_address[1]}/v1"
+
+    process = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        process = spawn_server(args.port, stub_url, args.server_log)
+    else:
+        print(f"[REPLAY] Start the server with WOC_FAST_MODELS=local:replay WOC_STRONG_MODELS=local:replay "
+              f"WOC_LOCAL_BASE_URL={stub_url}", file=sys.stderr)
+    try:
+        wait_ready(url, process=process)
+        pid = process.pid if process else args.pid
+        sampler = MemorySampler(pid) if pid else None
+        if sampler:
+            sampler.start()
+        print(f"[REPLAY] {len(records)} requests, {len({r.get('thread') for r in records})} threads, "
+              f"speed={args.speed}x, inject_latency={args.inject_latency}", file=sys.stderr)
+        replay = Replay(url, records, args.speed, run_id=f"{int(time.time())}")
+        wall_time = replay.run(args.max_threads)
+        summary = replay.summary(wall_time)
+        if sampler:
+            sampler.stop()
+            summary["memory"] = sampler.summary()
+        summary["stub"] = {"llm_calls": stub.calls, "unmatched": stub.unmatched}
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        stub_server.shutdown()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary))
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
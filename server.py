@@ -1,30 +1,57 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify
 from agent.graph import will_of_code as code_agent
 from agent.mcp_client import list_mcp_tools, call_mcp_tool_sync
+from agent.llm import provider_stats
+from agent.diffing import select_hunks, StaleBaseError, InvalidHunkError
+from agent.file_io import atomic_write, atomic_write_text, text_chunks, write_patch, WriteConflict, CHUNK_SIZE
+from agent import file_cache
+from agent.singleflight import singleflight_stats
+from agent.watcher import start_watcher
+from agent.listing import list_directory, DEFAULT_PAGE_SIZE
 from langgraph.types import Command
+from compression import init_compression
+from profiling import init_profiling, is_admin
+from capture import captured, capture_stats
+import hashlib
+import json
 import os
+import queue
 
 app = Flask(__name__, static_folder='static')
 
+# Per-request cProfile/tracemalloc on demand (admin) or sampled; registered first so it wraps compression
+init_profiling(app)
 
+# Precompressed static assets + br/gzip for large JSON responses
+static_assets = init_compression(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+
+# Invalidates file/listing caches and feeds /api/events (set WOC_WATCH=0 to disable)
+watcher = start_watcher() if os.getenv('WOC_WATCH', '1') != '0' else None
 
 
 @app.route('/')
 def index():
-    return send_from_directory('static', 'index.html')
+    return static_assets.response('index.html')
 
 @app.route('/styles.css')
 def styles():
-    return send_from_directory('static', 'styles.css')
+    return static_assets.response('styles.css')
 
 @app.route('/script.js')
 def script():
-    return send_from_directory('static', 'script.js')
+    return static_assets.response('script.js')
+
+
 
 
+def thread_config(data: dict) -> dict:
+    """Checkpointer config for the client's chat session (shared "default" thread if none given)"""
+    thread_id = str(data.get('thread_id') or 'default')[:128]
+    return {"configurable": {"thread_id": thread_id}}
 
 
 @app.route('/api/chat', methods=['POST'])
+@captured('chat')
 def chat():
     """Handle chat messages"""
     data = request.json
@@ -39,11 +66,13 @@ def chat():
         return jsonify({'error': 'No message'}), 400
     
     try:
-        # Configuration for checkpointer (requires thread_id)
-        config = {"configurable": {"thread_id": "default"}}
+        # One checkpointer thread per chat session, which also scopes conversation memory
+        config = thread_config(data)
         
         # Build initial state
-        state = {"user_query": message}
+        # Fresh per-turn outputs: the thread's checkpoint still holds the previous turn's
+        state = {"user_query": message, "tool_mode": bool(data.get('tools')),
+                 "pending_action": None, "action_data": None, "code": None}
         if data.get('file_path'):
             state["file_path"] = data['file_path']
         if data.get('file_content'):
@@ -74,10 +103,31 @@ def get_mcp_tools():
     return jsonify({'tools': tools})
 
 
+@app.route('/api/models', methods=['GET'])
+def get_models():
+    """Get model tiers and live per-provider latency/error stats"""
+    return jsonify(provider_stats())
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request coalescing, cache, watcher and traffic capture counters (admin)"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        'singleflight': singleflight_stats(),
+        'file_cache': file_cache.stats(),
+        'watcher': watcher.stats() if watcher else None,
+        'capture': capture_stats(),
+    })
+
+
 @app.route('/api/confirm', methods=['POST'])
+@captured('confirm')
 def confirm_action():
     """Handle accept/reject for code changes and file operations.
-    - For code edits: Accept = update editor (temporary), user must Save
+    - For code edits: Accept = apply accepted hunks to the verified base and
+      update the editor (temporary), user must Save
     - For delete: Accept = actually delete the file via MCP
     """
     data = request.json
@@ -85,7 +135,7 @@ def confirm_action():
     action_data = data.get('action_data', {})
     action_type = action_data.get('type', 'code_edit')
     
-    config = {"configurable": {"thread_id": "default"}}
+    config = thread_config(data)
     
     # Handle delete action immediately (destructive)
     if action == 'accept' and action_type == 'delete':
@@ -102,6 +152,22 @@ def confirm_action():
             else:
                 return jsonify({'success': False, 'error': f'Delete failed: {result}'}), 500
     
+    # Handle write_file proposed by the tool agent (refused if the file changed meanwhile)
+    if action == 'accept' and action_type == 'write_file':
+        path = action_data.get('path', '')
+        if not path:
+            return jsonify({'success': False, 'error': 'No path provided'}), 400
+        result = call_mcp_tool_sync("write_file", path=path, content=action_data.get('content', ''),
+                                    expected_hash=action_data.get('expected_hash', ''))
+        if result and not result.startswith("ERROR"):
+            return jsonify({
+                'success': True,
+                'message': f'File written: {path}',
+                'response': f'File `{path}` has been written.',
+                'action': action
+            })
+        return jsonify({'success': False, 'error': f'Write failed: {result}'}), 409 if 'modified since' in result else 500
+    
     # Handle run_python action
     if action == 'accept' and action_type == 'run_python':
         code = action_data.get('code', '')
@@ -116,21 +182,35 @@ def confirm_action():
         else:
             return jsonify({'success': False, 'error': 'No code provided'}), 400
     
-    # Resume the LangGraph by providing the user's action to the interrupt
+    # Resume the LangGraph by providing the user's action to the interrupt.
+    # For edits, `accepted` lists the hunk indexes to keep (omit for all of them)
     try:
-        result = code_agent.invoke(Command(resume=action), config=config)
+        resume = {'approved': action == 'accept', 'accepted': action_data.get('accepted')}
+        result = code_agent.invoke(Command(resume=resume), config=config)
+        applied = result.get("action_data") or {}
+        
+        if action == 'accept' and applied.get('error'):
+            return jsonify({'success': False, 'error': applied['error'], 'action': action}), 409
         
         if action == 'accept':
             message = "Changes applied to editor. Click Save to write to file."
         else:
             message = "Changes rejected."
-            
-        return jsonify({
+        
+        response = {
             'success': True, 
             'message': message,
             'response': message,
             'action': action
-        })
+        }
+        if action == 'accept' and applied.get('hunks') is not None:
+            # Client applies the same hunks to its buffer and can check the result hash
+            response.update({
+                'base_hash': applied.get('base_hash'),
+                'result_hash': applied.get('result_hash'),
+                'hunks': select_hunks(applied['hunks'], applied.get('accepted')),
+            })
+        return jsonify(response)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -145,55 +225,55 @@ def confirm_action():
 
 @app.route('/api/files', methods=['GET'])
 def list_files():
-    """List files in a directory"""
+    """List files in a directory, one page at a time.
+    Query params: path, cursor, limit, ext (comma-separated), hidden (0/1),
+    prefix, fields (comma-separated: size, mtime)
+    """
     path = request.args.get('path', os.path.expanduser('~'))
+    extensions = [e.strip() for e in request.args.get('ext', '').split(',') if e.strip()]
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
     
     try:
-        if not os.path.exists(path):
-            return jsonify({'error': 'Path not found'}), 404
-        if not os.path.isdir(path):
-            return jsonify({'error': 'Not a directory'}), 400
-        
-        items = []
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            try:
-                items.append({
-                    'name': item,
-                    'path': item_path,
-                    'isDirectory': os.path.isdir(item_path),
-                    'extension': os.path.splitext(item)[1].lower()
-                })
-            except:
-                continue
-        
-        # Sort: folders first, then files
-        items.sort(key=lambda x: (not x['isDirectory'], x['name'].lower()))
-        
-        return jsonify({
-            'currentPath': path,
-            'parentPath': os.path.dirname(path),
-            'items': items
-        })
+        return jsonify(list_directory(
+            path,
+            cursor=request.args.get('cursor') or None,
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            extensions=extensions,
+            include_hidden=request.args.get('hidden', '1') != '0',
+            prefix=request.args.get('prefix') or None,
+            fields=fields,
+        ))
+    except FileNotFoundError:
+        return jsonify({'error': 'Path not found'}), 404
+    except NotADirectoryError:
+        return jsonify({'error': 'Not a directory'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/file/read', methods=['GET'])
 def read_file():
-    """Read a file"""
+    """Read a file. `hash` identifies the version for optimistic-concurrency writes."""
     path = request.args.get('path', '')
     
     if not path or not os.path.exists(path):
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        with open(path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Same newline handling as text mode
+        content = data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+        if watcher:
+            watcher.watch(os.path.dirname(os.path.abspath(path)))
         return jsonify({
             'path': path,
+            'absPath': os.path.abspath(path),
             'content': content,
-            'filename': os.path.basename(path)
+            'filename': os.path.basename(path),
+            'hash': hashlib.sha256(data).hexdigest(),
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -201,22 +281,82 @@ def read_file():
 
 @app.route('/api/file/write', methods=['POST'])
 def write_file():
-    """Write to a file"""
-    data = request.json
-    path = data.get('path', '')
-    content = data.get('content', '')
-    
-    if not path:
-        return jsonify({'error': 'No path'}), 400
-    
+    """Write to a file atomically (temp file + fsync + rename).
+    - JSON {path, content}: whole file
+    - JSON {path, mode: "patch", base_hash, hunks}: only the changed line ranges
+    - Raw body (application/octet-stream, may be chunked) with ?path=: UTF-8 text streamed
+      to disk, with the same newline handling as the JSON modes ('\n' -> os.linesep)
+    Send the hash from /api/file/read as `base_hash` (JSON) or `If-Match` (raw) to
+    get 412 instead of overwriting a file that changed since it was read.
+    """
     try:
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return jsonify({'success': True, 'path': path})
+        if request.is_json:
+            data = request.json
+            path = data.get('path', '')
+            if not path:
+                return jsonify({'error': 'No path'}), 400
+            if data.get('mode') == 'patch':
+                if not data.get('base_hash'):
+                    return jsonify({'error': 'base_hash is required in patch mode'}), 400
+                version = write_patch(path, data.get('hunks', []), data.get('base_hash', ''))
+            else:
+                version = atomic_write_text(path, data.get('content', ''), expected_hash=data.get('base_hash'))
+        else:
+            path = request.args.get('path', '')
+            if not path:
+                return jsonify({'error': 'No path'}), 400
+            expected_hash = request.headers.get('If-Match', '').strip().strip('"') or None
+            chunks = iter(lambda: request.stream.read(CHUNK_SIZE), b'')
+            version = atomic_write(path, text_chunks(chunks), expected_hash=expected_hash)
+        file_cache.invalidate(path)
+        return jsonify({'success': True, 'path': path, 'hash': version['hash'], 'size': version['size']})
+    except WriteConflict as e:
+        return jsonify({
+            'error': 'File changed on disk since it was opened',
+            'conflict': True,
+            'current_hash': e.current['hash'] if e.current else None,
+        }), 412
+    except InvalidHunkError as e:
+        return jsonify({'error': str(e)}), 400
+    except StaleBaseError as e:
+        return jsonify({'error': str(e), 'conflict': True}), 412
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/events', methods=['GET'])
+def file_events():
+    """Server-sent events: `change` batches for watched files and folders"""
+    if watcher is None:
+        return jsonify({'error': 'File watching is disabled'}), 404
+    
+    batches = queue.Queue(maxsize=1000)
+    
+    def on_batch(batch):
+        try:
+            batches.put_nowait(batch)
+        except queue.Full:
+            pass    # Client is not reading; it resyncs on reconnect
+    
+    unsubscribe = watcher.subscribe(on_batch)
+    
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    batch = batches.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps({'changes': batch})}\n\n"
+        finally:
+            unsubscribe()
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/drives', methods=['GET'])
 def list_drives():
     """List available drives (Windows)"""
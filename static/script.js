@@ -9,7 +9,7 @@ if (sidebarClose) { sidebarClose.addEventListener('click', closeSidebar); }
 function createOverlay() { const overlay = document.createElement('div'); overlay.className = 'sidebar-overlay show'; overlay.id = 'sidebarOverlay'; overlay.addEventListener('click', closeSidebar); document.body.appendChild(overlay); }
 function closeSidebar() { sidebar.classList.remove('open'); const overlay = document.getElementById('sidebarOverlay'); if (overlay) overlay.remove(); }
 if (newChatBtn) { newChatBtn.addEventListener('click', () => { saveChatSession(); clearMessages(); currentSessionId = Date.now().toString(); closeSidebar(); showToast('New chat started', 'success'); }); }
-if (clearChatBtn) { clearChatBtn.addEventListener('click', () => { if (messagesContainer.children.length === 0) { showToast('Chat is already empty', 'info'); return; } clearMessages(); showToast('Chat cleared', 'success'); }); }
+if (clearChatBtn) { clearChatBtn.addEventListener('click', () => { if (messagesContainer.children.length === 0) { showToast('Chat is already empty', 'info'); return; } clearMessages(); currentSessionId = Date.now().toString(); showToast('Chat cleared', 'success'); }); }
 function clearMessages() { messagesContainer.innerHTML = ''; if (welcomeScreen) { welcomeScreen.style.display = 'flex'; } }
 function saveChatSession() { if (messagesContainer.children.length === 0) return; const firstMessage = messagesContainer.querySelector('.message.user .msg-content'); const title = firstMessage ? firstMessage.textContent.substring(0, 40) + '...' : 'Chat Session'; const session = { id: currentSessionId, title: title, timestamp: Date.now(), messages: messagesContainer.innerHTML }; const existingIndex = chatSessions.findIndex(s => s.id === currentSessionId); if (existingIndex >= 0) { chatSessions[existingIndex] = session; } else { chatSessions.unshift(session); } chatSessions = chatSessions.slice(0, 20); localStorage.setItem('chatSessions', JSON.stringify(chatSessions)); loadChatHistory(); }
 function loadChatHistory() { if (!chatHistory) return; chatHistory.innerHTML = chatSessions.map(session => `<div class="chat-history-item" data-id="${session.id}"><div class="title">${escapeHtml(session.title)}</div><div class="time">${formatTimestamp(session.timestamp)}</div></div>`).join(''); chatHistory.querySelectorAll('.chat-history-item').forEach(item => { item.addEventListener('click', () => { const session = chatSessions.find(s => s.id === item.dataset.id); if (session) { saveChatSession(); currentSessionId = session.id; messagesContainer.innerHTML = session.messages; if (welcomeScreen) welcomeScreen.style.display = 'none'; closeSidebar(); chatContainer.scrollTop = chatContainer.scrollHeight; } }); }); }
@@ -36,7 +36,7 @@ chatForm.addEventListener('submit', async function (e) {
     const loadingEl = addLoadingMessage();
 
     try {
-        const requestBody = { message };
+        const requestBody = { message, thread_id: currentSessionId };
         if (codeEditor && codeEditor.value) {
             requestBody.file_content = codeEditor.value;
             if (currentEditorFile) {
@@ -65,17 +65,19 @@ chatForm.addEventListener('submit', async function (e) {
             const pendingAction = data.pending_action;
             const actionData = data.action_data;
 
-            if (pendingAction === 'stream_to_editor' && actionData && actionData.code && editorSynced) {
+            if (pendingAction === 'stream_to_editor' && actionData && actionData.hunks && editorSynced) {
                 if (actionData.path && actionData.path !== currentEditorFile) {
                     await loadFileInEditor(actionData.path);
                 }
-                showPendingChanges(actionData.code, actionData.changes || 'Code changes');
+                showPendingChanges(actionData, actionData.changes || 'Code changes');
             } else if (pendingAction === 'stream_to_editor' && !editorSynced) {
                 showToast('Editor disconnected - changes shown in chat only', 'info');
             } else if (pendingAction === 'delete') {
                 showToast('Click Accept to confirm deletion', 'warning');
             } else if (pendingAction === 'run_python') {
                 showToast('Click Accept to run Python code', 'warning');
+            } else if (pendingAction === 'write_file') {
+                showToast('Click Accept to write the file', 'warning');
             }
 
             saveChatSession();
@@ -95,11 +97,46 @@ chatForm.addEventListener('submit', async function (e) {
 let pendingNewCode = null, originalEditorCode = null;
 const changeButtons = document.getElementById('changeButtons'), acceptChangeBtn = document.getElementById('acceptChangeBtn'), rejectChangeBtn = document.getElementById('rejectChangeBtn');
 
-function showPendingChanges(newCode, summary) {
+async function showPendingChanges(actionData, summary) {
     if (!codeEditor) return;
     const originalCode = codeEditor.value;
+    const baseHash = await sha256Hex(originalCode);
+    if (baseHash && actionData.base_hash && baseHash !== actionData.base_hash) {
+        showToast('Editor content changed since the request - diff may not apply', 'warning');
+    }
     openEditor();
-    showDiffModal(originalCode, newCode, currentEditorFile || 'Untitled', summary);
+    let newCode;
+    try {
+        newCode = applyHunks(originalCode, actionData.hunks);
+    } catch (error) {
+        showToast(error.message, 'error');
+        return;
+    }
+    showDiffModal(originalCode, newCode, currentEditorFile || actionData.path || 'Untitled', summary, actionData);
+}
+
+// Hunks from the server: {old_start, old_count, lines} with 0-based line indexes
+function splitLines(text) {
+    const parts = (text || '').split('\n');
+    const lines = parts.slice(0, -1).map(part => part + '\n');
+    if (parts[parts.length - 1]) lines.push(parts[parts.length - 1]);
+    return lines;
+}
+
+function applyHunks(base, hunks, accepted) {
+    const lines = splitLines(base);
+    const selected = hunks.filter((_, i) => !accepted || accepted.includes(i)).sort((a, b) => b.old_start - a.old_start);
+    for (const hunk of selected) {
+        if (hunk.old_start + hunk.old_count > lines.length) throw new Error('Diff does not match the editor content');
+        lines.splice(hunk.old_start, hunk.old_count, ...hunk.lines);
+    }
+    return lines.join('');
+}
+
+async function sha256Hex(text) {
+    if (!window.crypto || !crypto.subtle) return null;
+    const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
 }
 
 function acceptChanges() {
@@ -322,11 +359,15 @@ if (goUpBtn) { goUpBtn.addEventListener('click', () => { if (parentPath) { loadF
 if (goPathBtn) { goPathBtn.addEventListener('click', () => { if (pathInput.value.trim()) { loadFiles(pathInput.value.trim()); } }); }
 if (pathInput) { pathInput.addEventListener('keydown', (e) => { if (e.key === 'Enter') { loadFiles(pathInput.value.trim()); } }); }
 
-async function loadFiles(path) {
-    fileList.innerHTML = '<div class="file-list-loading">Loading...</div>';
+const FILE_PAGE_SIZE = 500;
+
+async function loadFiles(path, cursor) {
+    if (!cursor) fileList.innerHTML = '<div class="file-list-loading">Loading...</div>';
     try {
-        const url = path ? `/api/files?path=${encodeURIComponent(path)}` : '/api/files';
-        const response = await fetch(url);
+        const params = new URLSearchParams({ limit: FILE_PAGE_SIZE, fields: 'size' });
+        if (path) params.set('path', path);
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/files?${params}`);
         const data = await response.json();
         if (data.error) {
             fileList.innerHTML = `<div class="file-list-loading">Error: ${data.error}</div>`;
@@ -336,27 +377,37 @@ async function loadFiles(path) {
         currentPath = data.currentPath;
         parentPath = data.parentPath;
         pathInput.value = currentPath;
-        renderFileList(data.items);
+        renderFileList(data.items, !!cursor, data.nextCursor);
     } catch (error) {
         fileList.innerHTML = '<div class="file-list-loading">Failed to load files</div>';
         showToast('Failed to load files', 'error');
     }
 }
 
-function renderFileList(items) {
-    if (items.length === 0) {
+function renderFileList(items, append, nextCursor) {
+    fileList.querySelector('.file-list-more')?.remove();
+    if (!append && items.length === 0) {
         fileList.innerHTML = '<div class="file-list-loading">Empty folder</div>';
         return;
     }
-    fileList.innerHTML = items.map(item => `<div class="file-item ${item.isDirectory ? 'directory' : ''}" data-path="${escapeHtml(item.path)}" data-is-dir="${item.isDirectory}" data-name="${escapeHtml(item.name)}"><div class="file-icon">${getFileIcon(item)}</div><div class="file-info"><div class="file-name">${escapeHtml(item.name)}</div><div class="file-meta">${item.isDirectory ? 'Folder' : formatFileSize(item.size)}</div></div></div>`).join('');
-    fileList.querySelectorAll('.file-item').forEach(item => {
+    const html = items.map(item => `<div class="file-item ${item.isDirectory ? 'directory' : ''}" data-path="${escapeHtml(item.path)}" data-is-dir="${item.isDirectory}" data-name="${escapeHtml(item.name)}"><div class="file-icon">${getFileIcon(item)}</div><div class="file-info"><div class="file-name">${escapeHtml(item.name)}</div><div class="file-meta">${item.isDirectory ? 'Folder' : formatFileSize(item.size)}</div></div></div>`).join('');
+    if (append) { fileList.insertAdjacentHTML('beforeend', html); } else { fileList.innerHTML = html; }
+    fileList.querySelectorAll('.file-item:not([data-bound])').forEach(item => {
+        item.dataset.bound = '1';
         item.addEventListener('click', () => handleFileClick(item));
         item.addEventListener('dblclick', () => handleFileDoubleClick(item));
     });
+    if (nextCursor) {
+        const more = document.createElement('div');
+        more.className = 'file-list-loading file-list-more';
+        more.textContent = 'Load more...';
+        more.addEventListener('click', () => { more.textContent = 'Loading...'; loadFiles(currentPath, nextCursor); });
+        fileList.appendChild(more);
+    }
 }
 
 function getFileIcon(item) { return item.isDirectory ? '' : ''; }
-function formatFileSize(bytes) { if (bytes === 0) return '0 B'; const k = 1024; const sizes = ['B', 'KB', 'MB', 'GB']; const i = Math.floor(Math.log(bytes) / Math.log(k)); return parseFloat((bytes / Math.pow(k, i)).toFixed(1)) + ' ' + sizes[i]; }
+function formatFileSize(bytes) { if (bytes == null) return ''; if (bytes === 0) return '0 B'; const k = 1024; const sizes = ['B', 'KB', 'MB', 'GB']; const i = Math.floor(Math.log(bytes) / Math.log(k)); return parseFloat((bytes / Math.pow(k, i)).toFixed(1)) + ' ' + sizes[i]; }
 
 function handleFileClick(item) {
     fileList.querySelectorAll('.file-item.selected').forEach(el => el.classList.remove('selected'));
@@ -420,7 +471,7 @@ document.addEventListener('keydown', (e) => { if (e.key === 'Escape' && fileBrow
 
 // Editor
 const toggleEditorBtn = document.getElementById('toggleEditorBtn'), editorPanel = document.getElementById('editorPanel'), mainContent = document.getElementById('mainContent'), editorFileName = document.getElementById('editorFileName'), editorPath = document.getElementById('editorPath'), codeEditor = document.getElementById('codeEditor'), lineNumbers = document.getElementById('lineNumbers'), editorSaveBtn = document.getElementById('editorSaveBtn'), editorBrowseBtn = document.getElementById('editorBrowseBtn'), editorStatus = document.getElementById('editorStatus'), editorInfo = document.getElementById('editorInfo');
-let currentEditorFile = null, originalContent = '', isEditorModified = false;
+let currentEditorFile = null, currentEditorAbsPath = null, originalContent = '', originalHash = null, isEditorModified = false;
 
 if (toggleEditorBtn) { toggleEditorBtn.addEventListener('click', toggleEditor); }
 
@@ -440,7 +491,9 @@ async function loadFileInEditor(path) {
             return;
         }
         currentEditorFile = path;
+        currentEditorAbsPath = data.absPath || path;
         originalContent = data.content;
+        originalHash = data.hash || null;
         codeEditor.value = data.content;
         editorPath.value = path;
         editorFileName.textContent = data.filename;
@@ -484,23 +537,55 @@ if (codeEditor) {
     });
 }
 
-async function saveEditorFile() {
-    if (!currentEditorFile || !isEditorModified) return;
-    editorStatus.textContent = 'Saving...';
-    try {
-        const response = await fetch('/api/file/write', {
+// Single hunk covering everything between the unchanged head and tail
+function buildPatch(oldText, newText) {
+    const oldLines = splitLines(oldText), newLines = splitLines(newText);
+    let head = 0;
+    while (head < oldLines.length && head < newLines.length && oldLines[head] === newLines[head]) head++;
+    let tail = 0;
+    while (tail < oldLines.length - head && tail < newLines.length - head && oldLines[oldLines.length - 1 - tail] === newLines[newLines.length - 1 - tail]) tail++;
+    if (head === oldLines.length && head === newLines.length) return null;
+    return { old_start: head, old_count: oldLines.length - head - tail, lines: newLines.slice(head, newLines.length - tail) };
+}
+
+function writeEditorFile(content, baseHash) {
+    const patch = baseHash ? buildPatch(originalContent, content) : null;
+    if (patch && JSON.stringify(patch.lines).length < content.length / 2) {
+        // Small edit to a big file: send only the changed lines
+        return fetch('/api/file/write', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ path: currentEditorFile, content: codeEditor.value })
+            body: JSON.stringify({ path: currentEditorFile, mode: 'patch', base_hash: baseHash, hunks: [patch] })
         });
+    }
+    const headers = { 'Content-Type': 'application/octet-stream' };
+    if (baseHash) headers['If-Match'] = `"${baseHash}"`;
+    return fetch(`/api/file/write?path=${encodeURIComponent(currentEditorFile)}`, { method: 'POST', headers, body: content });
+}
+
+async function saveEditorFile(force) {
+    if (!currentEditorFile || !isEditorModified) return;
+    editorStatus.textContent = 'Saving...';
+    try {
+        const content = codeEditor.value;
+        const response = await writeEditorFile(content, force === true ? null : originalHash);
         const data = await response.json();
+        if (data.conflict) {
+            editorStatus.textContent = 'Conflict';
+            if (confirm('This file changed on disk since you opened it. Overwrite it with your version?')) {
+                return saveEditorFile(true);
+            }
+            showToast('Save cancelled - file changed on disk', 'warning');
+            return;
+        }
         if (data.error) {
             showToast(data.error, 'error');
             editorStatus.textContent = 'Save failed';
             return;
         }
-        originalContent = codeEditor.value;
-        setEditorModified(false);
+        originalContent = content;
+        originalHash = data.hash || null;
+        setEditorModified(codeEditor.value !== originalContent);
         editorStatus.className = 'editor-status saved';
         editorStatus.textContent = 'Saved';
         showToast('File saved successfully', 'success');
@@ -568,18 +653,39 @@ const diffAcceptBtn = document.getElementById('diffAcceptBtn');
 const diffRejectBtn = document.getElementById('diffRejectBtn');
 let pendingDiffData = null;
 
-function showDiffModal(originalCode, newCode, fileName, summary) {
+function showDiffModal(originalCode, newCode, fileName, summary, actionData) {
     if (!diffModal) return;
-    pendingDiffData = { originalCode, newCode, fileName };
+    pendingDiffData = { originalCode, newCode, fileName, actionData: actionData || null };
     if (diffFileName) diffFileName.textContent = fileName || 'Code Changes';
     if (diffSummary) diffSummary.innerHTML = `<strong>Changes:</strong> ${escapeHtml(summary || 'Code modifications')}`;
     if (diffView) {
-        const diffHtml = generateSimpleDiff(originalCode, newCode);
+        const diffHtml = actionData && actionData.hunks ? generateHunkDiff(originalCode, actionData.hunks) : generateSimpleDiff(originalCode, newCode);
         diffView.innerHTML = diffHtml;
     }
     diffModal.classList.add('open');
 }
 
+function generateHunkDiff(originalCode, hunks) {
+    const oldLines = splitLines(originalCode);
+    let html = '<div class="diff-container">';
+    html += `<div class="diff-header"><span class="diff-old">Original</span> - <span class="diff-new">New</span> (${hunks.length} change${hunks.length === 1 ? '' : 's'})</div>`;
+    html += '<div class="diff-view">';
+    let offset = 0;
+    hunks.forEach((hunk, index) => {
+        const newStart = hunk.old_start + offset;
+        offset += hunk.lines.length - hunk.old_count;
+        html += `<label class="diff-hunk-header"><input type="checkbox" class="diff-hunk-toggle" data-hunk="${index}" checked> @@ -${hunk.old_start + 1},${hunk.old_count} +${newStart + 1},${hunk.lines.length} @@</label>`;
+        oldLines.slice(hunk.old_start, hunk.old_start + hunk.old_count).forEach((line, i) => {
+            html += `<div class="diff-line removed"><span class="diff-line-number">${hunk.old_start + i + 1}</span><span class="diff-line-content">${escapeHtml(line.replace(/\n$/, '')) || ' '}</span></div>`;
+        });
+        hunk.lines.forEach((line, i) => {
+            html += `<div class="diff-line added"><span class="diff-line-number">${newStart + i + 1}</span><span class="diff-line-content">${escapeHtml(line.replace(/\n$/, '')) || ' '}</span></div>`;
+        });
+    });
+    html += '</div></div>';
+    return html;
+}
+
 function generateSimpleDiff(oldCode, newCode) {
     const oldLines = (oldCode || '').split('\n');
     const newLines = (newCode || '').split('\n');
@@ -622,17 +728,34 @@ function closeDiffModal() {
 async function acceptDiffChanges() {
     if (!pendingDiffData) return;
     const filePath = currentEditorFile || pendingDiffData.fileName;
-    const newCode = pendingDiffData.newCode;
+    const actionData = pendingDiffData.actionData;
+    let newCode = pendingDiffData.newCode;
+    let confirmData = { path: filePath, code: newCode };
+    if (actionData && actionData.hunks) {
+        // Partial accept: only the ticked hunks are applied, server-side and in the editor
+        const accepted = Array.from(diffView.querySelectorAll('.diff-hunk-toggle')).filter(box => box.checked).map(box => Number(box.dataset.hunk));
+        newCode = applyHunks(pendingDiffData.originalCode, actionData.hunks, accepted);
+        confirmData = { type: actionData.type, path: filePath, base_hash: actionData.base_hash, accepted };
+    }
     if (diffAcceptBtn) {
         diffAcceptBtn.disabled = true;
         diffAcceptBtn.innerHTML = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><circle cx="12" cy="12" r="10"/></svg>Applying...';
     }
     try {
-        await fetch('/api/confirm', {
+        const response = await fetch('/api/confirm', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ action: 'accept', action_data: { path: filePath, code: newCode } })
+            body: JSON.stringify({ thread_id: currentSessionId, action: 'accept', action_data: confirmData })
         });
+        const data = await response.json();
+        if (data.error) {
+            // Refused (e.g. stale base): keep the editor on the content the server has
+            showToast(data.error, 'warning');
+            return;
+        }
+        if (data.result_hash && ![null, data.result_hash].includes(await sha256Hex(newCode))) {
+            showToast('Editor result differs from the server copy - review before saving', 'warning');
+        }
         if (codeEditor && newCode) {
             codeEditor.value = newCode;
             updateLineNumbers();
@@ -671,7 +794,7 @@ async function rejectDiffChanges() {
         await fetch('/api/confirm', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ action: 'reject', action_data: {} })
+            body: JSON.stringify({ thread_id: currentSessionId, action: 'reject', action_data: {} })
         });
         showToast('Changes rejected', 'info');
     } catch (error) {
@@ -687,13 +810,13 @@ if (diffModalBackdrop) diffModalBackdrop.addEventListener('click', closeDiffModa
 
 // Handle confirm actions (Accept/Reject buttons in chat)
 window.handleConfirmAction = async function (action, actionData) {
-    // Handle delete action
-    if (action === 'accept' && actionData && actionData.type === 'delete') {
+    // Handle delete action (and whole-file writes proposed by the tool agent)
+    if (action === 'accept' && actionData && (actionData.type === 'delete' || actionData.type === 'write_file')) {
         try {
             const response = await fetch('/api/confirm', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ action: 'accept', action_data: actionData })
+                body: JSON.stringify({ thread_id: currentSessionId, action: 'accept', action_data: actionData })
             });
             const data = await response.json();
             if (data.success) {
@@ -716,7 +839,7 @@ window.handleConfirmAction = async function (action, actionData) {
             const response = await fetch('/api/confirm', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ action: 'accept', action_data: actionData })
+                body: JSON.stringify({ thread_id: currentSessionId, action: 'accept', action_data: actionData })
             });
             const data = await response.json();
             if (data.success) {
@@ -734,7 +857,9 @@ window.handleConfirmAction = async function (action, actionData) {
     }
 
     // Handle code edit action
-    if (action === 'accept' && actionData && actionData.code) {
+    if (action === 'accept' && actionData && actionData.hunks) {
+        showPendingChanges(actionData, actionData.changes || 'Code changes');
+    } else if (action === 'accept' && actionData && actionData.code) {
         const originalCode = codeEditor ? codeEditor.value : '';
         showDiffModal(originalCode, actionData.code, currentEditorFile || actionData.path || 'Untitled', actionData.changes || 'Code changes');
     } else if (action === 'reject') {
@@ -797,7 +922,9 @@ if (clearEditorBtn) {
             }
             codeEditor.value = '';
             currentEditorFile = null;
+            currentEditorAbsPath = null;
             originalContent = '';
+            originalHash = null;
             editorPath.value = '';
             editorFileName.textContent = 'No file open';
             updateLineNumbers();
@@ -813,3 +940,49 @@ if (clearEditorBtn) {
 window.editorSynced = () => editorSynced;
 window.closeEditor = closeEditor;
 window.openEditor = openEditor;
+
+// Live file change notifications from the server's watcher
+// Our own saves also produce events: only react when the disk copy differs from what the editor is based on
+async function reloadIfChangedOnDisk() {
+    const path = currentEditorFile;
+    try {
+        const response = await fetch(`/api/file/read?path=${encodeURIComponent(path)}`);
+        const data = await response.json();
+        if (data.error || path !== currentEditorFile || data.hash === originalHash) return;
+        if (isEditorModified) {
+            showToast('The open file changed on disk - saving will ask before overwriting', 'warning');
+            return;
+        }
+        const { selectionStart, selectionEnd, scrollTop } = codeEditor;
+        originalContent = data.content;
+        originalHash = data.hash || null;
+        codeEditor.value = data.content;
+        codeEditor.setSelectionRange(Math.min(selectionStart, data.content.length), Math.min(selectionEnd, data.content.length));
+        codeEditor.scrollTop = scrollTop;
+        updateLineNumbers();
+        updateEditorInfo();
+        setEditorModified(false);
+    } catch (error) {
+        console.error('Error checking the open file:', error);
+    }
+}
+
+function handleFileChanges(changes) {
+    changes.forEach(change => {
+        if (currentEditorAbsPath && change.path === currentEditorAbsPath) {
+            if (change.kind === 'deleted') {
+                showToast('The open file was deleted on disk', 'warning');
+            } else {
+                reloadIfChangedOnDisk();
+            }
+        }
+    });
+    if (fileBrowserModal.classList.contains('open') && currentPath && changes.some(change => change.dir === currentPath || change.path === currentPath)) {
+        loadFiles(currentPath);
+    }
+}
+
+if (window.EventSource) {
+    const fileEvents = new EventSource('/api/events');
+    fileEvents.addEventListener('change', (e) => { handleFileChanges(JSON.parse(e.data).changes); });
+}